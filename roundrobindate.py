@@ -1,6 +1,14 @@
 #!/usr/bin/env python
 
-from datetime import date, timedelta
+# Prune hooks import this module once per short-lived process, so modules
+# only some classes need (csv, hashlib, json, multiprocessing) are imported
+# where they are used.
+import heapq
+import struct
+from array import array
+from bisect import bisect_right
+from datetime import MAXYEAR, MINYEAR, date, timedelta
+from itertools import islice
 
 
 class RoundRobinDate:
@@ -12,17 +20,50 @@ class RoundRobinDate:
     documentation, including unit tests.
     """
 
+    TIER_NONE = 0
+    TIER_TODAY = 1
+    TIER_DAY = 2
+    TIER_WEEK = 4
+    TIER_MONTH = 8
+    TIER_YEAR = 16
+    TIER_NAMES = [
+        (TIER_TODAY, "today"),
+        (TIER_DAY, "day"),
+        (TIER_WEEK, "week"),
+        (TIER_MONTH, "month"),
+        (TIER_YEAR, "year")
+    ]
+
     def __init__(self, options=""):
+        self.options = None
+        self.options_parser = None
+        self.pending_options = []
         self.set_options(options)
 
     def set_options(self, options):
-        if not hasattr(self, "options_parser"):
+        if options:
+            self.pending_options.append(dict(options))
+            self.options = None
+
+    def _get_parsed_options(self):
+        """
+        Options are parsed on first use instead of in set_options(), so
+        constructing a RoundRobinDate and setting its options is cheap and
+        invalid options raise from the first query.
+        """
+        if self.options is None:
+            self.options = self._parse_pending_options()
+        return self.options
+
+    def _parse_pending_options(self):
+        if self.options_parser is None:
             self.options_parser = RoundRobinDateOptionsParser()
-        self.options_parser.set_options(options)
-        self.options = self.options_parser.get_options()
+        while self.pending_options:
+            self.options_parser.set_options(self.pending_options.pop(0))
+        return self.options_parser.get_options()
 
     def get_options(self):
-        return self.options.copy()
+        return self._get_parsed_options().copy()
     
     def get_today(self):
         date_dict = self._generate_todays_date()
@@ -30,7 +71,7 @@ class RoundRobinDate:
         return date_string
 
     def _generate_todays_date(self):
-        current_date = self.options["current_date"]
+        current_date = self._get_parsed_options()["current_date"]
         current_date_dict = self._generate_date_dict(current_date)
         return current_date_dict
 
@@ -46,142 +87,414 @@ class RoundRobinDate:
 
     def _generate_dates(self):
         dates = {}
-        dates.update(self._generate_todays_date())
-        dates.update(self._generate_day_dates())
-        dates.update(self._generate_week_dates())
-        dates.update(self._generate_month_dates())
-        dates.update(self._generate_year_dates())
+        current_date = self._get_parsed_options()["current_date"]
+        for ordinal, tiers in self._get_tier_ordinals(current_date):
+            retained_date = date.fromordinal(ordinal)
+            dates[retained_date.isoformat()] = retained_date
         return dates
 
-    def _generate_day_dates(self):
-        dates = {}
-        current_date = self.options["current_date"]
-        number_to_generate = self.options.get("days_to_retain")
-        for i in xrange(number_to_generate):
-            current_date = self._get_previous_day(current_date)
-            date_dict = self._generate_date_dict(current_date)
-            dates.update(date_dict)
-        return dates
+    def _get_tier_ordinals(self, input_date):
+        """
+        Returns (ordinal, tiers) pairs for every date retained on input_date,
+        newest first, where tiers is a bitmask of the TIER_* values holding
+        the date.
+        """
+        return self._merge_tier_ordinals(input_date,
+                self._get_month_ordinals(input_date),
+                self._get_year_ordinals(input_date))
+
+    def _merge_tier_ordinals(self, input_date, month_ordinals, year_ordinals):
+        """
+        Day ordinals are the bulk of most policies and never overlap each
+        other, so they seed the dict in one call and the coarser tiers OR in
+        their bits before a single sort.
+        """
+        tier_ordinals = dict.fromkeys(self._get_day_ordinals(input_date),
+                                      self.TIER_DAY)
+        tier_ordinals[input_date.toordinal()] = self.TIER_TODAY
+        for ordinals, tier in (
+                (self._get_week_ordinals(input_date), self.TIER_WEEK),
+                (month_ordinals, self.TIER_MONTH),
+                (year_ordinals, self.TIER_YEAR)):
+            for ordinal in ordinals:
+                tier_ordinals[ordinal] = tier_ordinals.get(ordinal, 0) | tier
+        return sorted(tier_ordinals.items(), reverse=True)
 
-    def _get_previous_day(self, input_date):
-        interval = timedelta(days=1)
-        previous_day = input_date - interval
-        return previous_day
+    def get_dates_for(self, current_dates):
+        """
+        Returns an RRDDateSets holding the dates retained on each of the
+        given current dates, without changing the current_date option.
+        Month and year tiers only change when they roll over, so nearby
+        current dates share them.
+        """
+        current_dates = [RRDDateParser().parse(current_date)
+                         for current_date in current_dates]
+        date_sets = RRDDateSets(current_dates)
+        month_cache = [None, []]
+        year_cache = [None, []]
+        for current_date in current_dates:
+            tier_ordinals = self._merge_tier_ordinals(current_date,
+                    self._get_cached_month_ordinals(current_date, month_cache),
+                    self._get_cached_year_ordinals(current_date, year_cache))
+            date_sets.append(tier_ordinals)
+        return date_sets
 
-    def _generate_week_dates(self):
-        dates = {}
-        current_date = self.options["current_date"]
-        current_week_date = self._get_first_week(current_date)
-        number_to_generate = self.options.get("weeks_to_retain")
-        for i in xrange(number_to_generate):
-            date_dict = self._generate_date_dict(current_week_date)
-            dates.update(date_dict)
-            current_week_date = self._get_previous_week(current_week_date)
-        return dates
+    def _get_cached_month_ordinals(self, input_date, cache):
+        " Reuses cache[1] while the month tier is unchanged since cache[0] "
+        key = (self._get_first_month_index(input_date),
+               self._get_months_in_range(input_date))
+        if cache[0] != key:
+            cache[0] = key
+            cache[1] = self._get_month_ordinals(input_date)
+        return cache[1]
+
+    def _get_cached_year_ordinals(self, input_date, cache):
+        key = (self._get_first_year_number(input_date),
+               self._get_years_in_range(input_date))
+        if cache[0] != key:
+            cache[0] = key
+            cache[1] = self._get_year_ordinals(input_date)
+        return cache[1]
+
+    def _get_ordinals(self, input_date):
+        """
+        Returns the ordinals of every date retained on input_date, tier by
+        tier, without changing the current_date option. Dates held by more
+        than one tier are repeated.
+        """
+        ordinals = [input_date.toordinal()]
+        ordinals.extend(self._get_day_ordinals(input_date))
+        ordinals.extend(self._get_week_ordinals(input_date))
+        ordinals.extend(self._get_month_ordinals(input_date))
+        ordinals.extend(self._get_year_ordinals(input_date))
+        return ordinals
+
+    def _get_day_ordinals(self, input_date):
+        number_to_generate = self._get_days_in_range(input_date)
+        first_day = input_date.toordinal() - 1
+        return range(first_day, first_day - number_to_generate, -1)
 
-    def _get_first_week(self, input_date):
+    def _get_days_in_range(self, input_date):
         """
-        Picks a day of the week based on the backup_day_of_week value.
-        Excludes the current day.
+        Number of day dates to generate, clamped so the oldest never falls
+        before the floor date.
         """
+        days_to_retain = self._get_parsed_options().get("days_to_retain")
+        days_in_range = (input_date - self._get_floor_date()).days
+        return max(0, min(days_to_retain, days_in_range))
+
+    def _get_floor_date(self):
+        floor_date = self._get_parsed_options().get("floor_date")
+        if floor_date:
+            return floor_date
+        return date.min
+
+    def _get_week_ordinals(self, input_date):
+        number_to_generate = self._get_weeks_in_range(input_date)
+        days_back = self._get_days_back_to_first_week(input_date)
+        first_week = input_date.toordinal() - days_back
+        return range(first_week, first_week - 7 * number_to_generate, -7)
+
+    def _get_weeks_in_range(self, input_date):
+        weeks_to_retain = self._get_parsed_options().get("weeks_to_retain")
+        days_back = self._get_days_back_to_first_week(input_date)
+        days_in_range = (input_date - self._get_floor_date()).days - days_back
+        if days_in_range < 0:
+            return 0
+        return min(weeks_to_retain, days_in_range // 7 + 1)
+
+    def _get_days_back_to_first_week(self, input_date):
         days_in_week = 7
-        backup_day_of_week = self.options.get("backup_day_of_week")
+        options = self._get_parsed_options()
+        backup_day_of_week = options.get("backup_day_of_week")
         current_day_of_week = input_date.isoweekday()
         if current_day_of_week > backup_day_of_week:
             days_back = current_day_of_week - backup_day_of_week
         else:
             days_back = (current_day_of_week + days_in_week) - backup_day_of_week
-        first_week = input_date - timedelta(days=days_back)
-        return first_week
+        return days_back
 
-    def _get_previous_week(self, input_date):
-        interval = timedelta(weeks=1)
-        previous_week = input_date - interval
-        return previous_week
+    def _get_month_ordinals(self, input_date):
+        number_to_generate = self._get_months_in_range(input_date)
+        first_month = self._get_first_month_index(input_date)
+        day = self._get_parsed_options()["backup_day_of_month"]
+        return RRDCalendar().get_ordinals(first_month, number_to_generate, day)
 
-    def _generate_month_dates(self):
-        dates = {}
-        current_date = self.options["current_date"]
-        current_month_date = self._get_first_month(current_date)
-        number_to_generate = self.options.get("months_to_retain")
-        for i in xrange(number_to_generate):
-            date_dict = self._generate_date_dict(current_month_date)
-            dates.update(date_dict)
-            current_month_date = self._get_previous_month(current_month_date)
-        return dates
+    def _get_months_in_range(self, input_date):
+        """
+        Counts month backup dates between the floor date and input date
+        without constructing them, so huge months_to_retain values stop at
+        the floor date instead of stepping past datetime.MINYEAR.
+        """
+        options = self._get_parsed_options()
+        months_to_retain = options.get("months_to_retain")
+        day = options["backup_day_of_month"]
+        first_month = self._get_first_month_index(input_date)
+        floor_date = self._get_floor_date()
+        last_month = self._get_month_index(floor_date)
+        if floor_date.day > day:
+            last_month = last_month + 1
+        return max(0, min(months_to_retain, first_month - last_month + 1))
 
-    def _get_first_month(self, input_date):
-        day = self.options["backup_day_of_month"]
-        month = input_date.month
-        year = input_date.year
-        current_month = date(year, month, day)
-        if current_month >= input_date:
-            current_month = self._get_previous_month(current_month)
-        return current_month
-
-    def _get_previous_month(self, input_date):
-        day = input_date.day
-        month = input_date.month
-        year = input_date.year
-        if month == 1:
-            month = 12
-            year = year - 1
-        else:
-            month = month - 1
-        previous_month = date(year, month, day)
-        return previous_month
+    def _get_first_month_index(self, input_date):
+        " Month index of the latest month backup date before input_date "
+        day = self._get_parsed_options()["backup_day_of_month"]
+        first_month = self._get_month_index(input_date)
+        if input_date.day <= day:
+            first_month = first_month - 1
+        return first_month
 
-    def _generate_year_dates(self):
-        dates = {}
-        current_date = self.options["current_date"]
-        current_year_date = self._get_first_year(current_date)
-        number_to_generate = self.options.get("years_to_retain")
-        for i in xrange(number_to_generate):
-            date_dict = self._generate_date_dict(current_year_date)
-            dates.update(date_dict)
-            current_year_date = self._get_previous_year(current_year_date)
-        return dates
+    def _get_month_index(self, input_date):
+        return input_date.year * 12 + input_date.month - 1
 
-    def _get_first_year(self, input_date):
-        day = self.options["backup_day_of_month"]
-        month = self.options["backup_month_of_year"]
-        year = input_date.year
-        current_year = date(year, month, day)
-        if current_year >= input_date:
-            current_year = self._get_previous_year(current_year)
-        return current_year
-
-    def _get_previous_year(self, input_date):
-        day = input_date.day
-        month = input_date.month
-        year = input_date.year
-        year = year - 1
-        previous_year = date(year, month, day)
-        return previous_year
+    def _get_year_ordinals(self, input_date):
+        number_to_generate = self._get_years_in_range(input_date)
+        options = self._get_parsed_options()
+        month = options["backup_month_of_year"]
+        first_month = self._get_first_year_number(input_date) * 12 + month - 1
+        day = options["backup_day_of_month"]
+        return RRDCalendar().get_ordinals(first_month, number_to_generate, day,
+                12)
+
+    def _get_years_in_range(self, input_date):
+        options = self._get_parsed_options()
+        years_to_retain = options.get("years_to_retain")
+        backup_day = (options["backup_month_of_year"],
+                      options["backup_day_of_month"])
+        first_year = self._get_first_year_number(input_date)
+        floor_date = self._get_floor_date()
+        last_year = floor_date.year
+        if backup_day < (floor_date.month, floor_date.day):
+            last_year = last_year + 1
+        return max(0, min(years_to_retain, first_year - last_year + 1))
+
+    def _get_first_year_number(self, input_date):
+        " Year of the latest year backup date before input_date "
+        options = self._get_parsed_options()
+        backup_day = (options["backup_month_of_year"],
+                      options["backup_day_of_month"])
+        first_year = input_date.year
+        if backup_day >= (input_date.month, input_date.day):
+            first_year = first_year - 1
+        return first_year
 
     def get_dates_as_strings(self):
-        dates = self.get_dates()
-        dates_list = list(dates)
-        dates_list.sort(reverse=True)
-        return dates_list
+        current_date = self._get_parsed_options()["current_date"]
+        tier_ordinals = self._get_tier_ordinals(current_date)
+        return [date.fromordinal(ordinal).isoformat()
+                for ordinal, tiers in tier_ordinals]
+
+    def explain(self, dates=None):
+        """
+        Returns (date_string, tier_names) pairs explaining why each date is
+        retained, newest first. If dates are given, explains those dates
+        instead, in the given order, with no tier names for dates that are
+        not retained.
+        """
+        current_date = self._get_parsed_options()["current_date"]
+        tier_ordinals = self._get_tier_ordinals(current_date)
+        if dates is None:
+            return [(date.fromordinal(ordinal).isoformat(),
+                     self._get_tier_names(tiers))
+                    for ordinal, tiers in tier_ordinals]
+        retained = dict(tier_ordinals)
+        explained = []
+        for input_date in dates:
+            input_date = RRDDateParser().parse(input_date)
+            tiers = retained.get(input_date.toordinal(), self.TIER_NONE)
+            explained.append((input_date.isoformat(),
+                              self._get_tier_names(tiers)))
+        return explained
+
+    def _get_tier_names(self, tiers):
+        return [name for tier, name in self.TIER_NAMES if tiers & tier]
+
+    def get_dates_array(self):
+        """
+        Returns the retained dates as a NumPy datetime64[D] array, sorted
+        newest first. Requires NumPy.
+        """
+        numpy = self._import_numpy()
+        current_date = self._get_parsed_options()["current_date"]
+        ordinals = numpy.unique(self._get_ordinals(current_date))[::-1]
+        epoch = date(1970, 1, 1).toordinal()
+        return (ordinals - epoch).astype("M8[D]")
+
+    def classify_array(self, dates_array):
+        """
+        Returns a uint8 array with the tiers retaining each date in
+        dates_array, as a bitmask of the TIER_* values. Dates that are not
+        retained are TIER_NONE. Requires NumPy.
+        """
+        numpy = self._import_numpy()
+        options = self._get_parsed_options()
+        current_date = options["current_date"]
+        current = current_date.toordinal()
+        days = numpy.asarray(dates_array, dtype="M8[D]")
+        months = days.astype("M8[M]")
+        epoch = date(1970, 1, 1).toordinal()
+        ordinals = days.astype("i8") + epoch
+        month_indexes = months.astype("i8") + 1970 * 12
+        days_of_month = (days - months.astype("M8[D]")).astype("i8") + 1
+
+        tiers = numpy.zeros(ordinals.shape, dtype="u1")
+        tiers[ordinals == current] |= self.TIER_TODAY
+
+        oldest_day = current - self._get_days_in_range(current_date)
+        in_days = (ordinals >= oldest_day) & (ordinals < current)
+        tiers[in_days] |= self.TIER_DAY
+
+        first_week = current - self._get_days_back_to_first_week(current_date)
+        last_week = first_week - 7 * self._get_weeks_in_range(current_date)
+        in_weeks = (ordinals <= first_week) & (ordinals > last_week)
+        in_weeks &= (first_week - ordinals) % 7 == 0
+        tiers[in_weeks] |= self.TIER_WEEK
+
+        on_backup_day = days_of_month == options["backup_day_of_month"]
+        first_month = self._get_first_month_index(current_date)
+        last_month = first_month - self._get_months_in_range(current_date)
+        in_months = (month_indexes <= first_month) & (month_indexes > last_month)
+        tiers[in_months & on_backup_day] |= self.TIER_MONTH
+
+        years = month_indexes // 12
+        first_year = self._get_first_year_number(current_date)
+        last_year = first_year - self._get_years_in_range(current_date)
+        in_years = (years <= first_year) & (years > last_year)
+        in_years &= month_indexes % 12 == options["backup_month_of_year"] - 1
+        tiers[in_years & on_backup_day] |= self.TIER_YEAR
+        return tiers
+
+    def _import_numpy(self):
+        try:
+            import numpy
+        except ImportError:
+            raise Exception("NumPy is required for array output")
+        return numpy
+
+
+class RRDDateSets:
+    """
+    Compact result of RoundRobinDate.get_dates_for. The retained ordinals
+    and tier bitmasks of every current date are stored back to back, newest
+    first, and offsets[i]:offsets[i + 1] spans those of current_dates[i].
+    """
+    def __init__(self, current_dates):
+        self.current_dates = current_dates
+        self.ordinals = array("l")
+        self.tiers = array("B")
+        self.offsets = array("l", [0])
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def append(self, tier_ordinals):
+        if tier_ordinals:
+            ordinals, tiers = zip(*tier_ordinals)
+            self.ordinals.extend(ordinals)
+            self.tiers.extend(tiers)
+        self.offsets.append(len(self.ordinals))
+
+    def get_ordinals(self, index):
+        return self.ordinals[self.offsets[index]:self.offsets[index + 1]]
+
+    def get_tiers(self, index):
+        return self.tiers[self.offsets[index]:self.offsets[index + 1]]
+
+    def get_dates_as_strings(self, index):
+        return [date.fromordinal(ordinal).isoformat()
+                for ordinal in self.get_ordinals(index)]
+
+
+class RRDCalendar:
+    """
+    Process-wide table holding the ordinal of the first day of every month
+    in one 400 year Gregorian cycle, built on first use. The calendar
+    repeats every 400 years, so any month's first day is a table entry plus
+    a whole number of 146097 day cycles.
+
+    Backup days of the month are never greater than 28, so the month backup
+    date of any month is its first day's ordinal plus a constant offset. Month
+    and year tiers are then strided slices of the table, stepping back 1 or
+    12 months, instead of loops constructing date objects.
+    """
+    CYCLE_MONTHS = 400 * 12
+    CYCLE_DAYS = 146097
+    _month_starts = None
+
+    def get_month_starts(self):
+        if RRDCalendar._month_starts is None:
+            RRDCalendar._month_starts = self._build_month_starts()
+        return RRDCalendar._month_starts
+
+    def _build_month_starts(self):
+        days_in_month = [31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31]
+        month_starts = array("l")
+        ordinal = 1
+        for year in xrange(MINYEAR, MINYEAR + 400):
+            leap_year = year % 4 == 0 and (year % 100 != 0 or year % 400 == 0)
+            for month in xrange(12):
+                month_starts.append(ordinal)
+                ordinal = ordinal + days_in_month[month]
+                if month == 1 and leap_year:
+                    ordinal = ordinal + 1
+        return month_starts
+
+    def get_ordinal(self, month, day):
+        " Returns the ordinal of day in the month with the given month index "
+        cycle, index = divmod(month - MINYEAR * 12, self.CYCLE_MONTHS)
+        month_start = self.get_month_starts()[index]
+        return cycle * self.CYCLE_DAYS + month_start + day - 1
+
+    def get_ordinals(self, first_month, number_to_generate, day, step=1):
+        """
+        Returns the ordinals of day in number_to_generate months, starting
+        with first_month and stepping back step months at a time, stopping
+        at datetime.MINYEAR. Months are given as month indexes, year * 12 +
+        month - 1.
+        """
+        month_starts = self.get_month_starts()
+        ordinals = []
+        month = first_month - MINYEAR * 12
+        while number_to_generate > 0 and month >= 0:
+            cycle, index = divmod(month, self.CYCLE_MONTHS)
+            count = min(number_to_generate, index // step + 1)
+            stop = index - step * count
+            if stop < 0:
+                stop = None
+            offset = cycle * self.CYCLE_DAYS + day - 1
+            ordinals.extend([ordinal + offset
+                             for ordinal in month_starts[index:stop:-step]])
+            number_to_generate = number_to_generate - count
+            month = month - step * count
+        return ordinals
 
 
 class RoundRobinDateOptionsParser:
 
+    _validated_default_options = None
+
     def __init__(self, custom_options=""):
         self.set_default_options()
         self.set_options(custom_options)
 
     def set_default_options(self):
-        self.options = {}
-        default_options = self._get_default_options()
-        self.set_options(default_options)
+        self.options = self._get_validated_default_options()
+        self.options["current_date"] = date.today()
+
+    def _get_validated_default_options(self):
+        " Default options are only parsed once per process "
+        if RoundRobinDateOptionsParser._validated_default_options is None:
+            self.options = {}
+            self.set_options(self._get_default_options())
+            RoundRobinDateOptionsParser._validated_default_options = self.options
+        return RoundRobinDateOptionsParser._validated_default_options.copy()
 
     def _get_default_options(self):
         default_options = {
             "current_date": date.today(),
             "auto_correct_backup_dates": True,
             "anchor_date": None,
+            "floor_date": None,
             "backup_day_of_week": 1,
             "backup_day_of_month": 1,
             "backup_month_of_year": 1,
@@ -193,12 +506,19 @@ class RoundRobinDateOptionsParser:
         return default_options
 
     def set_options(self, new_options):
+        " Invalid options raise and leave the last valid options in place "
         if new_options:
+            previous_options = self.options.copy()
             self.options.update(new_options)
-            self._parse_options()
+            try:
+                self._parse_options()
+            except Exception:
+                self.options = previous_options
+                raise
 
     def _parse_options(self):
         self._parse_current_date_options()
+        self._parse_floor_date_options()
         self._parse_backup_options()
         self._parse_retain_options()
 
@@ -207,6 +527,12 @@ class RoundRobinDateOptionsParser:
         parsed_current_date = RRDDateParser().parse(current_date)
         self.options["current_date"] = parsed_current_date
 
+    def _parse_floor_date_options(self):
+        floor_date = self.options.get("floor_date")
+        if floor_date:
+            parsed_floor_date = RRDDateParser().parse(floor_date)
+            self.options["floor_date"] = parsed_floor_date
+
     def _parse_backup_options(self):
         parser = self._get_backup_options_parser()
         day_of_week = parser.get('day_of_week')
@@ -358,3 +684,1514 @@ class RRDOptionsDateParser:
 
     def get(self, value):
         return self.parsed[value]
+
+
+class RRDManifestPruner:
+    """
+    Applies per-dataset RoundRobinDate options to a snapshot manifest, a
+    JSONL or CSV file with one (dataset, snapshot_date, size) row per
+    line. Each dataset's retained dates are computed once, then the
+    manifest is streamed in chunks of lines so memory stays bounded by the
+    chunk size and the number of datasets, not the size of the manifest.
+
+    Chunks are parsed, classified and formatted as a whole, in worker
+    processes when processes > 1, so only raw lines and decision text cross
+    process boundaries. Decisions are written in manifest order.
+
+    Rows for datasets without options are always kept.
+    """
+    def __init__(self, dataset_options, current_date=None, chunk_size=10000,
+                 processes=1):
+        self.chunk_size = chunk_size
+        self.processes = processes
+        self.policies = {}
+        for dataset, options in dataset_options.iteritems():
+            options = dict(options)
+            if current_date:
+                options["current_date"] = current_date
+            dates = RoundRobinDate(options).get_dates()
+            self.policies[dataset] = frozenset(dates)
+
+    def prune(self, manifest_file, decisions_file, format="jsonl"):
+        """
+        Writes one keep/delete decision per manifest row to decisions_file,
+        in the same format and order as the manifest. Returns a dictionary
+        of per-dataset "kept", "deleted" and "reclaimed_bytes" totals.
+        """
+        fieldnames = RRDManifestReader(manifest_file, format).read_header()
+        RRDManifestWriter(decisions_file, format)
+        summary = {}
+        for decisions, totals in self._prune_chunks(
+                self._get_chunks(manifest_file), format, fieldnames):
+            decisions_file.write(decisions)
+            for dataset, dataset_totals in totals.iteritems():
+                self._add_totals(summary, dataset, dataset_totals)
+        return summary
+
+    def _prune_chunks(self, chunks, format, fieldnames):
+        if self.processes <= 1:
+            for lines in chunks:
+                yield _prune_manifest_lines(self.policies, format,
+                                            fieldnames, lines)
+            return
+        import multiprocessing
+        pool = multiprocessing.Pool(self.processes, _init_manifest_worker,
+                                    (self.policies,))
+        # At most two chunks per process are in flight, so a slow writer
+        # never lets the whole manifest pile up in the pool's queue
+        pending = []
+        try:
+            for lines in chunks:
+                pending.append(pool.apply_async(_prune_manifest_worker_lines,
+                                                (format, fieldnames, lines)))
+                if len(pending) >= 2 * self.processes:
+                    yield pending.pop(0).get()
+            while pending:
+                yield pending.pop(0).get()
+        finally:
+            pool.close()
+            pool.join()
+
+    def _get_chunks(self, lines):
+        while True:
+            chunk = list(islice(lines, self.chunk_size))
+            if not chunk:
+                break
+            yield chunk
+
+    def _add_totals(self, summary, dataset, totals):
+        summary_totals = summary.setdefault(dataset, {
+            "kept": 0,
+            "deleted": 0,
+            "reclaimed_bytes": 0
+        })
+        for key, value in totals.iteritems():
+            summary_totals[key] += value
+
+
+_manifest_worker_policies = {}
+
+
+def _init_manifest_worker(policies):
+    _manifest_worker_policies.update(policies)
+
+
+def _prune_manifest_worker_lines(format, fieldnames, lines):
+    return _prune_manifest_lines(_manifest_worker_policies, format,
+                                 fieldnames, lines)
+
+
+def _prune_manifest_lines(policies, format, fieldnames, lines):
+    """
+    Returns the decisions for a chunk of manifest lines, formatted as
+    text, and the chunk's per-dataset totals.
+    """
+    from cStringIO import StringIO
+    decisions = StringIO()
+    writer = RRDManifestWriter(decisions, format, header=False)
+    totals = {}
+    for row in RRDManifestReader(lines, format, fieldnames).rows():
+        retained = policies.get(row[0])
+        keep = retained is None or row[1] in retained
+        dataset_totals = totals.get(row[0])
+        if dataset_totals is None:
+            dataset_totals = totals[row[0]] = {
+                "kept": 0,
+                "deleted": 0,
+                "reclaimed_bytes": 0
+            }
+        if keep:
+            dataset_totals["kept"] += 1
+        else:
+            dataset_totals["deleted"] += 1
+            dataset_totals["reclaimed_bytes"] += row[2]
+        writer.write(row, keep)
+    return (decisions.getvalue(), totals)
+
+
+class RRDManifestReader:
+    """
+    Yields (dataset, snapshot_date, size) rows from a JSONL or CSV file.
+    CSV files start with a header row unless fieldnames are given.
+    """
+    def __init__(self, fileobj, format="jsonl", fieldnames=None):
+        if format not in ("jsonl", "csv"):
+            raise Exception("Manifest format must be 'jsonl' or 'csv'. "
+                            "Given '{0}'".format(format))
+        self.fileobj = fileobj
+        self.format = format
+        self.fieldnames = fieldnames
+
+    def read_header(self):
+        " Reads and returns a CSV file's header row, or None for JSONL "
+        if self.format != "csv":
+            return None
+        import csv
+        for fieldnames in csv.reader(self.fileobj):
+            return fieldnames
+        return []
+
+    def rows(self):
+        import csv
+        import json
+        if self.format == "csv":
+            records = csv.DictReader(self.fileobj, self.fieldnames)
+        else:
+            records = (json.loads(line) for line in self.fileobj
+                       if line.strip())
+        for record in records:
+            yield self._parse_record(record)
+
+    def _parse_record(self, record):
+        snapshot_date = RRDDateParser().parse(record["snapshot_date"][:10])
+        return (
+            record["dataset"],
+            snapshot_date.isoformat(),
+            int(record.get("size") or 0)
+        )
+
+
+class RRDManifestWriter:
+    " Writes keep/delete decisions for manifest rows as JSONL or CSV "
+    def __init__(self, fileobj, format="jsonl", header=True):
+        self.fileobj = fileobj
+        self.format = format
+        if format == "csv":
+            import csv
+            self.csv_writer = csv.writer(fileobj)
+            if header:
+                self.csv_writer.writerow(
+                        ["dataset", "snapshot_date", "size", "action"])
+
+    def write(self, row, keep):
+        dataset, snapshot_date, size = row
+        action = "keep" if keep else "delete"
+        if self.format == "csv":
+            self.csv_writer.writerow([dataset, snapshot_date, size, action])
+        else:
+            import json
+            record = {
+                "dataset": dataset,
+                "snapshot_date": snapshot_date,
+                "size": size,
+                "action": action
+            }
+            self.fileobj.write(json.dumps(record, sort_keys=True) + "\n")
+
+
+class RRDSizeModel:
+    """
+    Linear snapshot size model. A snapshot taken on a given date is
+    base_bytes plus daily_growth_bytes for every day after origin_date.
+    Sums over evenly spaced dates are computed in closed form.
+    """
+    def __init__(self, origin_date, base_bytes, daily_growth_bytes=0):
+        self.origin = RRDDateParser().parse(origin_date).toordinal()
+        self.base_bytes = base_bytes
+        self.daily_growth_bytes = daily_growth_bytes
+
+    def size(self, ordinal):
+        return self.base_bytes + self.daily_growth_bytes * (ordinal - self.origin)
+
+    def sum_range(self, first, last, step=1):
+        """
+        Total size of snapshots on ordinals first, first + step, ... last.
+        Branch free, so it also works elementwise on NumPy arrays.
+        """
+        count = ((last - first) // step + 1) * (last >= first)
+        last = first + (count - 1) * step
+        ordinal_sum = count * (first + last) // 2
+        growth = ordinal_sum - count * self.origin
+        return count * self.base_bytes + self.daily_growth_bytes * growth
+
+
+class RRDForecast:
+    """
+    Compact per-day retention forecast. Each array holds one value per
+    forecast day, starting with start_date. The day, week, month and year
+    arrays count the snapshots each tier adds beyond the finer tiers, so
+    together with the current day they sum to total.
+    """
+    def __init__(self, start_date, days):
+        self.start_date = start_date
+        self.total = array("l", [0]) * days
+        self.day = array("l", [0]) * days
+        self.week = array("l", [0]) * days
+        self.month = array("l", [0]) * days
+        self.year = array("l", [0]) * days
+        self.bytes = array("d", [0]) * days
+
+    def __len__(self):
+        return len(self.total)
+
+    def get_date(self, index):
+        return self.start_date + timedelta(days=index)
+
+    def get_row(self, index):
+        return (
+            self.get_date(index),
+            self.total[index],
+            self.day[index],
+            self.week[index],
+            self.month[index],
+            self.year[index],
+            self.bytes[index]
+        )
+
+
+class RRDForecaster:
+    """
+    Projects how many snapshots, and how many bytes, a RoundRobinDate
+    policy retains on each day of a horizon. Day and week tiers are closed
+    form ranges. Month and year tiers hold the latest backup dates before
+    each day, and their counts and sizes beyond the day and week tiers come
+    from prefix sums.
+
+    With NumPy installed every day of the horizon is computed at once with
+    array arithmetic, and the size model's size() and sum_range() are called
+    with int64 arrays. Otherwise days are computed one at a time, with the
+    month and year tiers only rebuilt when they roll over.
+    """
+    def __init__(self, policy):
+        self.policy = RoundRobinDate(policy.get_options())
+        self.options = self.policy.get_options()
+        self.floor = self.policy._get_floor_date().toordinal()
+
+    def forecast(self, start_date, days, size_model=None):
+        start_date = RRDDateParser().parse(start_date)
+        if size_model is None:
+            size_model = RRDSizeModel(start_date, 0)
+        try:
+            import numpy
+        except ImportError:
+            return self._forecast_days(start_date, days, size_model)
+        return self._forecast_arrays(numpy, start_date, days, size_model)
+
+    def _forecast_arrays(self, numpy, start_date, days, size_model):
+        start = start_date.toordinal()
+        current = numpy.arange(start, start + days, dtype="i8")
+        day_count = numpy.clip(current - self.floor, 0,
+                               self.options["days_to_retain"])
+        oldest_day = current - day_count
+        first_week = (current - 1 -
+                      (current - 1 - self.options["backup_day_of_week"]) % 7)
+        weeks = numpy.clip((first_week - self.floor) // 7 + 1, 0,
+                           self.options["weeks_to_retain"])
+        last_week = first_week - 7 * (weeks - 1)
+        weeks_in_days = numpy.clip((first_week - oldest_day) // 7 + 1, 0,
+                                   weeks)
+        total_bytes = size_model.size(current)
+        total_bytes = total_bytes + size_model.sum_range(oldest_day,
+                                                         current - 1)
+        total_bytes = total_bytes + size_model.sum_range(last_week,
+                first_week - 7 * weeks_in_days, 7)
+
+        end_date = start_date + timedelta(days=max(days - 1, 0))
+        months = self._get_tier_arrays(numpy, self._get_month_span(start_date,
+                end_date), size_model)
+        month_count, month_bytes, month_oldest = self._count_older_arrays(
+                numpy, months, self.options["months_to_retain"], current,
+                oldest_day, weeks, first_week, last_week)
+        years = self._get_tier_arrays(numpy, self._get_year_span(start_date,
+                end_date), size_model)
+        year_count, year_bytes, year_oldest = self._count_older_arrays(
+                numpy, years, self.options["years_to_retain"], current,
+                numpy.minimum(oldest_day, month_oldest), weeks, first_week,
+                last_week)
+        total_bytes = total_bytes + month_bytes + year_bytes
+
+        week_count = weeks - weeks_in_days
+        result = RRDForecast(start_date, days)
+        result.day = array("l", day_count.tolist())
+        result.week = array("l", week_count.tolist())
+        result.month = array("l", month_count.tolist())
+        result.year = array("l", year_count.tolist())
+        result.total = array("l", (1 + day_count + week_count + month_count +
+                                   year_count).tolist())
+        result.bytes = array("d", numpy.asarray(total_bytes,
+                                                dtype="f8").tolist())
+        return result
+
+    def _get_month_span(self, start_date, end_date):
+        """
+        Returns the month backup ordinals held by the month tier on any day
+        from start_date to end_date, newest first.
+        """
+        policy = self.policy
+        first_month = policy._get_first_month_index(end_date)
+        count = (first_month - policy._get_first_month_index(start_date) +
+                 policy._get_months_in_range(start_date))
+        return RRDCalendar().get_ordinals(first_month, count,
+                                          self.options["backup_day_of_month"])
+
+    def _get_year_span(self, start_date, end_date):
+        policy = self.policy
+        first_year = policy._get_first_year_number(end_date)
+        count = (first_year - policy._get_first_year_number(start_date) +
+                 policy._get_years_in_range(start_date))
+        first_month = first_year * 12 + self.options["backup_month_of_year"] - 1
+        return RRDCalendar().get_ordinals(first_month, count,
+                self.options["backup_day_of_month"], 12)
+
+    def _get_tier_arrays(self, numpy, ordinals, size_model):
+        """
+        Returns the ordinals, oldest first and on or after the floor date,
+        and those falling on the backup day of the week, each with the
+        prefix sums of their sizes.
+        """
+        ordinals = numpy.array(ordinals[::-1], dtype="i8")
+        ordinals = ordinals[ordinals >= self.floor]
+        on_week_day = ((ordinals - 1) % 7 ==
+                       self.options["backup_day_of_week"] - 1)
+        week_days = ordinals[on_week_day]
+        return (ordinals, self._get_prefix_sums(numpy, ordinals, size_model),
+                week_days, self._get_prefix_sums(numpy, week_days, size_model))
+
+    def _get_prefix_sums(self, numpy, ordinals, size_model):
+        sizes = numpy.asarray(size_model.size(ordinals))
+        return numpy.concatenate([[0], numpy.cumsum(sizes)])
+
+    def _count_older_arrays(self, numpy, tier, retain, current, limit, weeks,
+                            first_week, last_week):
+        """
+        Counts, and sums the sizes of, each day's tier dates before limit
+        that the week tier does not hold. A day's tier is the retain latest
+        ordinals before it. Also returns the oldest ordinal of each day's
+        tier, or the current ordinal when the tier is empty.
+        """
+        ordinals, sums, week_days, week_sums = tier
+        newest = numpy.searchsorted(ordinals, current)
+        oldest = numpy.maximum(newest - retain, 0)
+        older = numpy.clip(numpy.searchsorted(ordinals, limit), oldest, newest)
+        count = older - oldest
+        total_bytes = sums[older] - sums[oldest]
+
+        padded = numpy.append(ordinals, numpy.iinfo("i8").max)
+        oldest_ordinal = padded[oldest]
+        first = numpy.searchsorted(week_days, numpy.maximum(last_week,
+                                                            oldest_ordinal))
+        last = numpy.searchsorted(week_days, numpy.minimum(first_week,
+                                                           limit - 1), "right")
+        last = numpy.where(weeks > 0, numpy.maximum(last, first), first)
+        count = count - (last - first)
+        total_bytes = total_bytes - (week_sums[last] - week_sums[first])
+        return (count, total_bytes,
+                numpy.where(newest > oldest, oldest_ordinal, current))
+
+    def _forecast_days(self, start_date, days, size_model):
+        result = RRDForecast(start_date, days)
+        backup_day = self.options["backup_day_of_month"]
+        backup_month = self.options["backup_month_of_year"]
+        month_tiers = [None, None]
+        year_tiers = [None, None]
+        previous_day = None
+        for index in xrange(days):
+            current_date = start_date + timedelta(days=index)
+            # Month and year tiers only roll over the day after a backup day
+            if previous_day is None or previous_day.day == backup_day:
+                months = self._get_tiers(self.policy._get_month_ordinals(
+                    current_date), month_tiers, size_model)
+                if previous_day is None or previous_day.month == backup_month:
+                    years = self._get_tiers(self.policy._get_year_ordinals(
+                        current_date), year_tiers, size_model)
+            self._forecast_day(result, index, current_date, months, years,
+                    size_model)
+            previous_day = current_date
+        return result
+
+    def _get_tiers(self, ordinals, cache, size_model):
+        """
+        Returns RRDGridTiers of the ordinals and of those falling on the
+        backup day of the week, which the week tier may already hold.
+        Rebuilt only when the ordinals change.
+        """
+        if cache[0] != ordinals:
+            backup_day_of_week = self.options["backup_day_of_week"]
+            week_days = [ordinal for ordinal in ordinals
+                         if (ordinal - 1) % 7 + 1 == backup_day_of_week]
+            cache[0] = ordinals
+            cache[1] = (RRDGridTier(ordinals, size_model),
+                        RRDGridTier(week_days, size_model))
+        return cache[1]
+
+    def _forecast_day(self, result, index, current_date, months, years,
+                      size_model):
+        current = current_date.toordinal()
+        days_in_range = current - self.floor
+        days = max(0, min(self.options["days_to_retain"], days_in_range))
+        oldest_day = current - days
+        first_week = self._get_first_week_ordinal(current)
+        weeks = 0
+        if first_week >= self.floor:
+            weeks = min(self.options["weeks_to_retain"],
+                        (first_week - self.floor) // 7 + 1)
+        last_week = first_week - 7 * (weeks - 1)
+
+        weeks_in_days = 0
+        if weeks and first_week >= oldest_day:
+            weeks_in_days = min(weeks, (first_week - oldest_day) // 7 + 1)
+        week_count = weeks - weeks_in_days
+        total_bytes = size_model.size(current)
+        total_bytes += size_model.sum_range(oldest_day, current - 1)
+        total_bytes += size_model.sum_range(last_week,
+                first_week - 7 * weeks_in_days, 7)
+
+        # Month dates from oldest_day on are day dates, and year dates from
+        # the oldest month date on are month dates
+        month_count, month_bytes = self._count_older(months, oldest_day,
+                weeks, first_week, last_week)
+        last_month = current
+        if len(months[0]):
+            last_month = months[0].ordinals[-1]
+        year_count, year_bytes = self._count_older(years,
+                min(oldest_day, last_month), weeks, first_week, last_week)
+        total_bytes += month_bytes + year_bytes
+
+        result.day[index] = days
+        result.week[index] = week_count
+        result.month[index] = month_count
+        result.year[index] = year_count
+        result.total[index] = 1 + days + week_count + month_count + year_count
+        result.bytes[index] = total_bytes
+
+    def _count_older(self, tiers, limit, weeks, first_week, last_week):
+        """
+        Counts, and sums the sizes of, the tier's dates before limit that
+        the week tier does not hold.
+        """
+        tier, week_days = tiers
+        first = tier.count_from(limit)
+        count = len(tier) - first
+        total_bytes = tier.sum(first, len(tier))
+        if weeks:
+            newest = min(first_week, limit - 1)
+            first = week_days.count_from(newest + 1)
+            last = week_days.count_from(last_week)
+            if last > first:
+                count -= last - first
+                total_bytes -= week_days.sum(first, last)
+        return (count, total_bytes)
+
+    def _get_first_week_ordinal(self, current):
+        backup_day_of_week = self.options["backup_day_of_week"]
+        current_day_of_week = (current - 1) % 7 + 1
+        days_back = current_day_of_week - backup_day_of_week
+        if days_back <= 0:
+            days_back = days_back + 7
+        return current - days_back
+
+
+def forecast(policy, start_date, days, size_model=None):
+    """
+    Returns an RRDForecast of the snapshots and bytes retained by the
+    RoundRobinDate policy on each of the given number of days.
+    """
+    return RRDForecaster(policy).forecast(start_date, days, size_model)
+
+
+class RRDGridTier:
+    """
+    One tier's retained ordinals, newest first, at its largest retain count.
+    A policy retaining fewer of the tier keeps a prefix, so counts, size
+    sums and gaps over any slice come from the tables built here.
+    """
+    def __init__(self, ordinals, size_model):
+        self.ordinals = ordinals
+        self.negated = [-ordinal for ordinal in ordinals]
+        self.sums = [0]
+        for ordinal in ordinals:
+            self.sums.append(self.sums[-1] + size_model.size(ordinal))
+        self.gaps = [ordinals[i] - ordinals[i + 1]
+                     for i in xrange(len(ordinals) - 1)]
+
+    def __len__(self):
+        return len(self.ordinals)
+
+    def count_from(self, ordinal):
+        " Number of ordinals on or after the given ordinal "
+        return bisect_right(self.negated, -ordinal)
+
+    def get_rank(self, ordinal, step):
+        " Rank of ordinal in an evenly spaced tier, or None "
+        if not self.ordinals or ordinal > self.ordinals[0]:
+            return None
+        rank, remainder = divmod(self.ordinals[0] - ordinal, step)
+        if remainder or rank >= len(self.ordinals):
+            return None
+        return rank
+
+    def sum(self, first, last):
+        return self.sums[last] - self.sums[first]
+
+    def max_gap(self, first, last):
+        if last - first < 2:
+            return 0
+        return max(self.gaps[first:last - 1])
+
+
+class RRDPolicyGrid:
+    """
+    Compares every combination of anchor dates and day, week, month and
+    year retain counts over a horizon, yielding one row per combination
+    with its peak snapshot count, largest gap in days between retained
+    backups and peak bytes.
+
+    Tiers are independent, so for each anchor and day every tier is built
+    once at its largest count and each grid cell combines prefixes of them
+    instead of simulating its own RoundRobinDate. Rows are yielded as each
+    anchor finishes, so memory is bounded by the number of cells.
+    """
+    columns = ("anchor_date", "days_to_retain", "weeks_to_retain",
+               "months_to_retain", "years_to_retain", "peak_count",
+               "max_gap", "peak_bytes")
+
+    def __init__(self, anchor_dates, days_to_retain, weeks_to_retain,
+                 months_to_retain, years_to_retain, options=None):
+        self.anchor_dates = [RRDDateParser().parse(anchor_date)
+                             for anchor_date in anchor_dates]
+        self.days_to_retain = sorted(set(days_to_retain))
+        self.weeks_to_retain = sorted(set(weeks_to_retain))
+        self.months_to_retain = sorted(set(months_to_retain))
+        self.years_to_retain = sorted(set(years_to_retain))
+        self.options = dict(options or {})
+
+    def evaluate(self, start_date, days, size_model=None):
+        start_date = RRDDateParser().parse(start_date)
+        if size_model is None:
+            size_model = RRDSizeModel(start_date, 0)
+        for anchor_date in self.anchor_dates:
+            for row in self._evaluate_anchor(anchor_date, start_date, days,
+                                             size_model):
+                yield row
+
+    def _get_policy(self, anchor_date):
+        options = dict(self.options)
+        options.update({
+            "anchor_date": anchor_date,
+            "days_to_retain": max(self.days_to_retain),
+            "weeks_to_retain": max(self.weeks_to_retain),
+            "months_to_retain": max(self.months_to_retain),
+            "years_to_retain": max(self.years_to_retain)
+        })
+        return RoundRobinDate(options)
+
+    def _evaluate_anchor(self, anchor_date, start_date, days, size_model):
+        policy = self._get_policy(anchor_date)
+        cells = (len(self.days_to_retain) * len(self.weeks_to_retain) *
+                 len(self.months_to_retain) * len(self.years_to_retain))
+        peak_count = array("l", [0]) * cells
+        max_gap = array("l", [0]) * cells
+        peak_bytes = array("d", [0]) * cells
+        caches = {"week": [None, None], "month": [None, None],
+                  "year": [None, None], "overlap": [None, None]}
+        for index in xrange(days):
+            current_date = start_date + timedelta(days=index)
+            tiers = self._get_tiers(policy, current_date, size_model, caches)
+            self._evaluate_day(policy, current_date, tiers, size_model,
+                               peak_count, max_gap, peak_bytes)
+
+        cell = 0
+        for days_to_retain in self.days_to_retain:
+            for weeks_to_retain in self.weeks_to_retain:
+                for months_to_retain in self.months_to_retain:
+                    for years_to_retain in self.years_to_retain:
+                        yield (anchor_date.isoformat(), days_to_retain,
+                               weeks_to_retain, months_to_retain,
+                               years_to_retain, peak_count[cell],
+                               max_gap[cell], peak_bytes[cell])
+                        cell += 1
+
+    def _get_tiers(self, policy, current_date, size_model, caches):
+        " Rebuilds each tier's tables only when the tier rolls over "
+        weeks = self._get_cached_tier(caches["week"],
+                (current_date.toordinal() -
+                 policy._get_days_back_to_first_week(current_date),
+                 policy._get_weeks_in_range(current_date)),
+                lambda: policy._get_week_ordinals(current_date), size_model)
+        months = self._get_cached_tier(caches["month"],
+                (policy._get_first_month_index(current_date),
+                 policy._get_months_in_range(current_date)),
+                lambda: policy._get_month_ordinals(current_date), size_model)
+        years = self._get_cached_tier(caches["year"],
+                (policy._get_first_year_number(current_date),
+                 policy._get_years_in_range(current_date)),
+                lambda: policy._get_year_ordinals(current_date), size_model)
+        cache = caches["overlap"]
+        if cache[0] != (id(weeks), id(months), id(years)):
+            cache[0] = (id(weeks), id(months), id(years))
+            cache[1] = (self._get_week_overlaps(weeks, months),
+                        self._get_week_overlaps(weeks, years))
+        month_weeks, year_weeks = cache[1]
+        return weeks, months, years, month_weeks, year_weeks
+
+    def _get_cached_tier(self, cache, key, get_ordinals, size_model):
+        if cache[0] != key:
+            cache[0] = key
+            cache[1] = RRDGridTier(get_ordinals(), size_model)
+        return cache[1]
+
+    def _get_week_overlaps(self, weeks, tier):
+        """
+        (rank, week_rank, size) for each date in tier that is also a week
+        date, so cells can discount it when both tiers retain it.
+        """
+        overlaps = []
+        for rank, ordinal in enumerate(tier.ordinals):
+            week_rank = weeks.get_rank(ordinal, 7)
+            if week_rank is not None:
+                overlaps.append((rank, week_rank,
+                                 tier.sum(rank, rank + 1)))
+        return overlaps
+
+    def _evaluate_day(self, policy, current_date, tiers, size_model,
+                      peak_count, max_gap, peak_bytes):
+        weeks, months, years, month_weeks, year_weeks = tiers
+        current = current_date.toordinal()
+        days_in_range = policy._get_days_in_range(current_date)
+        cell = 0
+        for days_to_retain in self.days_to_retain:
+            day_count = min(days_to_retain, days_in_range)
+            oldest_day = current - day_count
+            day_bytes = (size_model.size(current) +
+                         size_model.sum_range(oldest_day, current - 1))
+            first_week = weeks.count_from(oldest_day)
+            first_month = months.count_from(oldest_day)
+            first_year = years.count_from(oldest_day)
+            for weeks_to_retain in self.weeks_to_retain:
+                last_week = max(first_week, min(weeks_to_retain, len(weeks)))
+                for months_to_retain in self.months_to_retain:
+                    month_count = min(months_to_retain, len(months))
+                    last_month = max(first_month, month_count)
+                    # Year dates inside the month span are month dates
+                    year_start = first_year
+                    if month_count:
+                        year_start = max(year_start, years.count_from(
+                            months.ordinals[month_count - 1]))
+                    for years_to_retain in self.years_to_retain:
+                        last_year = max(year_start,
+                                        min(years_to_retain, len(years)))
+                        count, total_bytes = self._count_cell(
+                            day_count, day_bytes, weeks, first_week,
+                            last_week, months, first_month, last_month,
+                            years, year_start, last_year, month_weeks,
+                            year_weeks)
+                        gap = self._get_cell_gap(oldest_day, day_count,
+                            weeks, first_week, last_week, months,
+                            first_month, last_month, years, year_start,
+                            last_year)
+                        if count > peak_count[cell]:
+                            peak_count[cell] = count
+                        if gap > max_gap[cell]:
+                            max_gap[cell] = gap
+                        if total_bytes > peak_bytes[cell]:
+                            peak_bytes[cell] = total_bytes
+                        cell += 1
+
+    def _count_cell(self, day_count, day_bytes, weeks, first_week,
+                    last_week, months, first_month, last_month, years,
+                    year_start, last_year, month_weeks, year_weeks):
+        count = (1 + day_count + (last_week - first_week) +
+                 (last_month - first_month) + (last_year - year_start))
+        total_bytes = (day_bytes + weeks.sum(first_week, last_week) +
+                       months.sum(first_month, last_month) +
+                       years.sum(year_start, last_year))
+        for overlaps, first, last in ((month_weeks, first_month, last_month),
+                                      (year_weeks, year_start, last_year)):
+            for rank, week_rank, size in overlaps:
+                if (first <= rank < last and
+                        first_week <= week_rank < last_week):
+                    count -= 1
+                    total_bytes -= size
+        return count, total_bytes
+
+    def _get_cell_gap(self, oldest_day, day_count, weeks, first_week,
+                      last_week, months, first_month, last_month, years,
+                      year_start, last_year):
+        """
+        Largest gap in days between retained dates. Month and year dates
+        are at least 28 days apart, so they can split every week gap only
+        when fewer than three weeks are retained past the day tier; that
+        case is merged explicitly.
+        """
+        gap = 1 if day_count else 0
+        newest = oldest_day
+        week_count = last_week - first_week
+        if week_count:
+            oldest_week = weeks.ordinals[last_week - 1]
+            if week_count >= 3:
+                gap = max(gap, 7)
+            else:
+                ordinals = weeks.ordinals[first_week:last_week]
+                ordinals.extend(months.ordinals[first_month:
+                    min(last_month, months.count_from(oldest_week))])
+                ordinals.extend(years.ordinals[year_start:
+                    min(last_year, years.count_from(oldest_week))])
+                for ordinal in sorted(set(ordinals), reverse=True):
+                    gap = max(gap, newest - ordinal)
+                    newest = ordinal
+            newest = oldest_week
+            first_month = max(first_month, months.count_from(newest))
+            year_start = max(year_start, years.count_from(newest))
+        if first_month < last_month:
+            gap = max(gap, newest - months.ordinals[first_month],
+                      months.max_gap(first_month, last_month))
+            newest = months.ordinals[last_month - 1]
+        if year_start < last_year:
+            gap = max(gap, newest - years.ordinals[year_start],
+                      years.max_gap(year_start, last_year))
+        return gap
+
+
+class RRDIntervalIndex:
+    """
+    Static centered interval tree over half-open (start, end) intervals.
+    Finding every interval containing a point takes O(log n + k) time.
+    """
+    def __init__(self, intervals):
+        intervals = [interval for interval in intervals
+                     if interval[0] < interval[1]]
+        self.root = self._build(sorted(intervals))
+
+    def _build(self, intervals):
+        if not intervals:
+            return None
+        center = intervals[len(intervals) // 2][0]
+        left = []
+        right = []
+        overlapping = []
+        for interval in intervals:
+            if interval[1] <= center:
+                left.append(interval)
+            elif interval[0] > center:
+                right.append(interval)
+            else:
+                overlapping.append(interval)
+        by_end = sorted(overlapping, key=lambda interval: -interval[1])
+        return (center, overlapping, by_end, self._build(left),
+                self._build(right))
+
+    def stab(self, point):
+        " Returns every interval where start <= point < end "
+        found = []
+        node = self.root
+        while node:
+            center, by_start, by_end, left, right = node
+            if point < center:
+                for interval in by_start:
+                    if interval[0] > point:
+                        break
+                    found.append(interval)
+                node = left
+            else:
+                for interval in by_end:
+                    if interval[1] <= point:
+                        break
+                    found.append(interval)
+                node = right
+        return found
+
+
+class RRDRetentionHistory:
+    """
+    Models a backup system that takes one backup a day from
+    first_backup_date and deletes every backup the policy no longer
+    retains, recording each backup's lifetime, from its own date until the
+    first day it is not retained. Lifetimes are kept in an RRDIntervalIndex,
+    so asking which backups existed on any past date is a stabbing query.
+
+    Every tier holds a backup on an unbroken run of days starting the day
+    after it is taken, so a backup's expiry is the day after the last tier
+    holding it lets it go, computed in closed form instead of by replaying
+    each day. Backups still retained on last_date are treated as never
+    expiring.
+    """
+    def __init__(self, policy, first_backup_date, last_date):
+        self.policy = RoundRobinDate(policy.get_options())
+        self.options = self.policy.get_options()
+        self.first = RRDDateParser().parse(first_backup_date).toordinal()
+        self.last = RRDDateParser().parse(last_date).toordinal()
+        self.index = RRDIntervalIndex(self._get_lifetimes())
+
+    def _get_lifetimes(self):
+        lifetimes = []
+        floor = self.policy._get_floor_date().toordinal()
+        never_expires = date.max.toordinal() + 1
+        for ordinal in xrange(self.first, self.last + 1):
+            expiry = ordinal + 1
+            if ordinal >= floor:
+                expiry = self._get_expiry(ordinal)
+            if expiry > self.last:
+                expiry = never_expires
+            lifetimes.append((ordinal, expiry))
+        return lifetimes
+
+    def _get_expiry(self, ordinal):
+        " First day a backup taken on or after the floor date is not retained "
+        options = self.options
+        expiry = ordinal + options["days_to_retain"] + 1
+        if (ordinal - 1) % 7 + 1 == options["backup_day_of_week"]:
+            expiry = max(expiry, ordinal + 7 * options["weeks_to_retain"] + 1)
+        backup_date = date.fromordinal(ordinal)
+        day = options["backup_day_of_month"]
+        if backup_date.day == day:
+            month = self.policy._get_month_index(backup_date)
+            expiry = max(expiry, self._get_month_expiry(
+                    month + options["months_to_retain"], day))
+            if backup_date.month == options["backup_month_of_year"]:
+                expiry = max(expiry, self._get_month_expiry(
+                        month + 12 * options["years_to_retain"], day))
+        return expiry
+
+    def _get_month_expiry(self, month, day):
+        """
+        The day after the backup day in the month with the given month
+        index, when the backup it replaces leaves the tier.
+        """
+        if month > MAXYEAR * 12 + 11:
+            return date.max.toordinal() + 1
+        return RRDCalendar().get_ordinal(month, day) + 1
+
+    def retained_on(self, as_of):
+        """
+        Returns the dates of backups on disk on as_of, after that day's
+        pruning, as ISO 8601 strings sorted newest first.
+        """
+        as_of = RRDDateParser().parse(as_of).toordinal()
+        if as_of > self.last:
+            raise Exception("Value for 'as_of' must not be after the last "
+                            "replayed date, '{0}'. Given '{1}'".format(
+                            date.fromordinal(self.last),
+                            date.fromordinal(as_of)))
+        ordinals = [start for start, end in self.index.stab(as_of)]
+        ordinals.sort(reverse=True)
+        return [date.fromordinal(ordinal).isoformat() for ordinal in ordinals]
+
+    def retained_on_many(self, as_of_dates):
+        return [self.retained_on(as_of) for as_of in as_of_dates]
+
+
+def retained_on(policy, first_backup_date, as_of):
+    """
+    Returns the backups on disk on as_of, under the RoundRobinDate policy,
+    for a daily backup system started on first_backup_date. A backup is
+    never retained again once a tier lets it go, so these are the policy's
+    dates on as_of from first_backup_date on, and no history is built.
+    """
+    first = RRDDateParser().parse(first_backup_date).toordinal()
+    as_of = RRDDateParser().parse(as_of)
+    return [date.fromordinal(ordinal).isoformat() for ordinal, tiers
+            in policy._get_tier_ordinals(as_of) if ordinal >= first]
+
+
+def retained_on_many(policy, first_backup_date, as_of_dates):
+    " Batch form of retained_on(), sharing one RRDRetentionHistory "
+    as_of_dates = [RRDDateParser().parse(as_of) for as_of in as_of_dates]
+    history = RRDRetentionHistory(policy, first_backup_date, max(as_of_dates))
+    return history.retained_on_many(as_of_dates)
+
+
+class RRDChangeScheduler:
+    """
+    Finds the dates on which the dates retained by one or more
+    RoundRobinDate policies change, and which tiers change on each. The
+    day tier rolls every day. The week, month and year tiers only roll on
+    the day after a backup day, so those dates are generated in closed
+    form and merged in date order with a priority queue.
+
+    The current day is always retained and changes every day, so it is not
+    reported as a change. Without a day tier, the previous day's backup
+    expires unless another tier keeps it, which is reported as a TIER_TODAY
+    change.
+    """
+    def __init__(self, policies):
+        self.policies = {}
+        for key, policy in policies.iteritems():
+            self.policies[key] = RoundRobinDate(policy.get_options())
+
+    def next_changes(self, after, n):
+        """
+        Returns the next n (date, key, tiers) changes after the given date,
+        in date order, where key identifies the policy and tiers is a bitmask
+        of the RoundRobinDate TIER_* values that change.
+        """
+        after = RRDDateParser().parse(after)
+        changes = []
+        for key in sorted(self.policies):
+            iterator = self._iter_changes(self.policies[key], after)
+            self._push_next(changes, key, iterator)
+        result = []
+        while changes and len(result) < n:
+            change_date, key, tiers, iterator = heapq.heappop(changes)
+            result.append((change_date, key, tiers))
+            self._push_next(changes, key, iterator)
+        return result
+
+    def _push_next(self, changes, key, iterator):
+        for change_date, tiers in iterator:
+            heapq.heappush(changes, (change_date, key, tiers, iterator))
+            break
+
+    def _iter_changes(self, policy, after):
+        tier_dates = heapq.merge(
+            self._iter_day_changes(policy, after),
+            self._iter_week_changes(policy, after),
+            self._iter_month_changes(policy, after),
+            self._iter_year_changes(policy, after)
+        )
+        current = None
+        current_tiers = 0
+        for ordinal, tier in tier_dates:
+            if ordinal != current:
+                if current_tiers:
+                    yield (date.fromordinal(current), current_tiers)
+                current = ordinal
+                current_tiers = 0
+            current_tiers = current_tiers | tier
+        if current_tiers:
+            yield (date.fromordinal(current), current_tiers)
+
+    def _iter_day_changes(self, policy, after):
+        for ordinal in xrange(after.toordinal() + 1, date.max.toordinal() + 1):
+            current_date = date.fromordinal(ordinal)
+            if policy._get_days_in_range(current_date):
+                yield (ordinal, RoundRobinDate.TIER_DAY)
+            elif not self._keeps_previous_day(policy, current_date):
+                yield (ordinal, RoundRobinDate.TIER_TODAY)
+
+    def _keeps_previous_day(self, policy, current_date):
+        """
+        Whether the week, month or year tier keeps the previous day's
+        backup. It is the newest date before current_date, so it can only
+        be the first date of each tier.
+        """
+        options = policy._get_parsed_options()
+        if (policy._get_days_back_to_first_week(current_date) == 1 and
+                policy._get_weeks_in_range(current_date)):
+            return True
+        previous_day = current_date - timedelta(days=1)
+        if previous_day.day != options["backup_day_of_month"]:
+            return False
+        if policy._get_months_in_range(current_date):
+            return True
+        return (previous_day.month == options["backup_month_of_year"] and
+                policy._get_years_in_range(current_date) > 0)
+
+    def _iter_week_changes(self, policy, after):
+        if not policy._get_parsed_options()["weeks_to_retain"]:
+            return
+        week_after = after + timedelta(weeks=1)
+        days_back = policy._get_days_back_to_first_week(week_after)
+        ordinal = week_after.toordinal() - days_back + 1
+        for ordinal in xrange(ordinal, date.max.toordinal() + 1, 7):
+            if policy._get_weeks_in_range(date.fromordinal(ordinal)):
+                yield (ordinal, RoundRobinDate.TIER_WEEK)
+
+    def _iter_month_changes(self, policy, after):
+        if not policy._get_parsed_options()["months_to_retain"]:
+            return
+        first_month = policy._get_first_month_index(after) + 1
+        for ordinal in self._iter_backup_days(policy, first_month, 1):
+            if policy._get_months_in_range(date.fromordinal(ordinal)):
+                yield (ordinal, RoundRobinDate.TIER_MONTH)
+
+    def _iter_year_changes(self, policy, after):
+        if not policy._get_parsed_options()["years_to_retain"]:
+            return
+        month = policy._get_parsed_options()["backup_month_of_year"]
+        first_year = policy._get_first_year_number(after) + 1
+        first_month = first_year * 12 + month - 1
+        for ordinal in self._iter_backup_days(policy, first_month, 12):
+            if policy._get_years_in_range(date.fromordinal(ordinal)):
+                yield (ordinal, RoundRobinDate.TIER_YEAR)
+
+    def _iter_backup_days(self, policy, first_month, step):
+        " Yields the ordinal of the day after each month backup day "
+        calendar = RRDCalendar()
+        day = policy._get_parsed_options()["backup_day_of_month"]
+        for month in xrange(first_month, MAXYEAR * 12 + 12, step):
+            yield calendar.get_ordinal(month, day) + 1
+
+
+def next_changes(policy, after, n):
+    """
+    Returns the next n (date, tiers) pairs after the given date on which the
+    dates retained by the RoundRobinDate policy change.
+    """
+    changes = RRDChangeScheduler({None: policy}).next_changes(after, n)
+    return [(change_date, tiers) for change_date, key, tiers in changes]
+
+
+class RRDCompiledPolicy(RoundRobinDate):
+    """
+    RoundRobinDate over options that have already been parsed, such as the
+    options of another RoundRobinDate or a row of an RRDPolicyTable. The
+    options parser is skipped entirely, so compiled policies are read-only.
+    """
+    def __init__(self, options):
+        self.options = options
+        self.options_parser = None
+        self.pending_options = []
+
+    def set_options(self, options):
+        raise Exception("Compiled policies are read-only, create a "
+                        "RoundRobinDate to change options. Given '{0}'".format(
+                        options))
+
+
+class RRDPolicyTable:
+    """
+    Packed table of policies, one fixed-width row per policy, stored in any
+    writable buffer: a bytearray, an mmap, a multiprocessing RawArray or a
+    multiprocessing.shared_memory buffer. Worker processes sharing the
+    buffer can evaluate any row by index without unpickling options or
+    running the options parser.
+
+    Each row holds the current date, anchor date and floor date ordinals
+    (0 when unset), the backup day of the week, day of the month and month
+    of the year, and the four retain counts.
+    """
+    row_struct = struct.Struct("<iiiBBBxiiii")
+    ROW_SIZE = row_struct.size
+    MAX_RETAIN = 2 ** 31 - 1
+
+    def __init__(self, buffer):
+        self.buffer = buffer
+        self.rows = len(buffer) // self.ROW_SIZE
+
+    def pack(self, index, policy):
+        options = policy.get_options()
+        retain_counts = [min(options[key], self.MAX_RETAIN) for key in (
+            "days_to_retain",
+            "weeks_to_retain",
+            "months_to_retain",
+            "years_to_retain"
+        )]
+        self.row_struct.pack_into(self.buffer, index * self.ROW_SIZE,
+            options["current_date"].toordinal(),
+            self._get_ordinal(options.get("anchor_date")),
+            self._get_ordinal(options.get("floor_date")),
+            options["backup_day_of_week"],
+            options["backup_day_of_month"],
+            options["backup_month_of_year"],
+            *retain_counts)
+
+    def _get_ordinal(self, input_date):
+        if input_date:
+            return input_date.toordinal()
+        return 0
+
+    def get_policy(self, index):
+        row = self.row_struct.unpack_from(self.buffer, index * self.ROW_SIZE)
+        options = {
+            "current_date": date.fromordinal(row[0]),
+            "anchor_date": self._get_date(row[1]),
+            "floor_date": self._get_date(row[2]),
+            "backup_day_of_week": row[3],
+            "backup_day_of_month": row[4],
+            "backup_month_of_year": row[5],
+            "days_to_retain": row[6],
+            "weeks_to_retain": row[7],
+            "months_to_retain": row[8],
+            "years_to_retain": row[9]
+        }
+        return RRDCompiledPolicy(options)
+
+    def _get_date(self, ordinal):
+        if ordinal:
+            return date.fromordinal(ordinal)
+        return None
+
+    def evaluate(self, index):
+        " Returns the ordinals retained by a row's policy, newest first "
+        policy = self.get_policy(index)
+        current_date = policy._get_parsed_options()["current_date"]
+        tier_ordinals = policy._get_tier_ordinals(current_date)
+        return [ordinal for ordinal, tiers in tier_ordinals]
+
+    def get_result_width(self):
+        " Upper bound on the number of dates retained by any row "
+        width = 1
+        for index in xrange(self.rows):
+            policy = self.get_policy(index)
+            current_date = policy._get_parsed_options()["current_date"]
+            width = max(width, 1 +
+                policy._get_days_in_range(current_date) +
+                policy._get_weeks_in_range(current_date) +
+                policy._get_months_in_range(current_date) +
+                policy._get_years_in_range(current_date))
+        return width
+
+
+class RRDResultTable:
+    """
+    Fixed-width rows of retained date ordinals, a count followed by width
+    ordinals, stored in any writable buffer so workers can write results
+    back to shared memory.
+    """
+    def __init__(self, buffer, width):
+        self.buffer = buffer
+        self.width = width
+        self.row_struct = struct.Struct(self._get_row_format(width))
+        self.rows = len(buffer) // self.row_struct.size
+
+    @staticmethod
+    def get_row_size(width):
+        return struct.calcsize(RRDResultTable._get_row_format(width))
+
+    @staticmethod
+    def _get_row_format(width):
+        return "<i{0}i".format(width)
+
+    def write(self, index, ordinals):
+        if len(ordinals) > self.width:
+            raise Exception("Row {0} has {1} dates, more than the table "
+                            "width of {2}".format(index, len(ordinals),
+                                                  self.width))
+        padding = [0] * (self.width - len(ordinals))
+        self.row_struct.pack_into(self.buffer, index * self.row_struct.size,
+                len(ordinals), *(list(ordinals) + padding))
+
+    def read(self, index):
+        row = self.row_struct.unpack_from(self.buffer,
+                index * self.row_struct.size)
+        return list(row[1:row[0] + 1])
+
+
+class RRDPolicyPool:
+    """
+    Evaluates many policies in a multiprocessing pool. Policies are packed
+    once into a shared RRDPolicyTable and workers write their results into a
+    shared RRDResultTable, so tasks only carry row index ranges.
+    """
+    def __init__(self, policies, processes=2, chunk_size=1000):
+        from multiprocessing.sharedctypes import RawArray
+        self.processes = processes
+        self.chunk_size = chunk_size
+        self.rows = len(policies)
+        policy_buffer = RawArray("c", self.rows * RRDPolicyTable.ROW_SIZE)
+        self.policy_table = RRDPolicyTable(policy_buffer)
+        for index, policy in enumerate(policies):
+            self.policy_table.pack(index, policy)
+        width = self.policy_table.get_result_width()
+        result_size = self.rows * RRDResultTable.get_row_size(width)
+        self.result_table = RRDResultTable(RawArray("c", result_size), width)
+
+    def evaluate(self):
+        " Evaluates every policy and returns the shared RRDResultTable "
+        if not self.rows:
+            return self.result_table
+        import multiprocessing
+        bounds = [(start, min(start + self.chunk_size, self.rows))
+                  for start in xrange(0, self.rows, self.chunk_size)]
+        pool = multiprocessing.Pool(self.processes, _init_policy_worker, (
+            self.policy_table.buffer,
+            self.result_table.buffer,
+            self.result_table.width
+        ))
+        try:
+            pool.map(_evaluate_policy_rows, bounds)
+        finally:
+            pool.close()
+            pool.join()
+        return self.result_table
+
+
+_policy_worker_tables = []
+
+
+def _init_policy_worker(policy_buffer, result_buffer, width):
+    _policy_worker_tables[:] = [
+        RRDPolicyTable(policy_buffer),
+        RRDResultTable(result_buffer, width)
+    ]
+
+
+def _evaluate_policy_rows(bounds):
+    policy_table, result_table = _policy_worker_tables
+    for index in xrange(*bounds):
+        result_table.write(index, policy_table.evaluate(index))
+
+
+class RRDSyncPlanner:
+    """
+    Plans the copies and deletes that bring two sites' backups in line with
+    each site's policy, for example a primary site and a replica running a
+    longer policy. Both inventories and both sets of retained dates are
+    sorted newest first, so they are combined in a single streaming merge.
+    """
+    PRIMARY = 1
+    SECONDARY = 2
+    PRIMARY_RETAINS = 4
+    SECONDARY_RETAINS = 8
+
+    def __init__(self, primary_policy, secondary_policy):
+        self.primary_policy = primary_policy
+        self.secondary_policy = secondary_policy
+
+    def plan(self, primary_inventory, secondary_inventory, current_date):
+        """
+        Yields (action, site, date_string) tuples, newest first, where
+        action is "copy" or "delete" and site is the "primary" or
+        "secondary" site the action applies to. A backup is copied to a
+        site that retains it but is missing it, before being deleted from a
+        site that no longer retains it. Inventories must be sorted newest
+        first, like get_dates_as_strings() output.
+        """
+        current_date = RRDDateParser().parse(current_date)
+        merged = heapq.merge(
+            self._tag_inventory(primary_inventory, self.PRIMARY),
+            self._tag_inventory(secondary_inventory, self.SECONDARY),
+            self._tag_retained(self.primary_policy, current_date,
+                               self.PRIMARY_RETAINS),
+            self._tag_retained(self.secondary_policy, current_date,
+                               self.SECONDARY_RETAINS)
+        )
+        previous = None
+        flags = 0
+        for negative_ordinal, flag in merged:
+            if negative_ordinal != previous:
+                for action in self._get_actions(previous, flags):
+                    yield action
+                previous = negative_ordinal
+                flags = 0
+            flags = flags | flag
+        for action in self._get_actions(previous, flags):
+            yield action
+
+    def _tag_inventory(self, inventory, flag):
+        for snapshot_date in inventory:
+            yield (-RRDDateParser().parse(snapshot_date).toordinal(), flag)
+
+    def _tag_retained(self, policy, current_date, flag):
+        for ordinal, tiers in policy._get_tier_ordinals(current_date):
+            yield (-ordinal, flag)
+
+    def _get_actions(self, negative_ordinal, flags):
+        actions = []
+        on_primary = flags & self.PRIMARY
+        on_secondary = flags & self.SECONDARY
+        if not (on_primary or on_secondary):
+            return actions
+        date_string = date.fromordinal(-negative_ordinal).isoformat()
+        if on_primary and not on_secondary and flags & self.SECONDARY_RETAINS:
+            actions.append(("copy", "secondary", date_string))
+        if on_secondary and not on_primary and flags & self.PRIMARY_RETAINS:
+            actions.append(("copy", "primary", date_string))
+        if on_primary and not flags & self.PRIMARY_RETAINS:
+            actions.append(("delete", "primary", date_string))
+        if on_secondary and not flags & self.SECONDARY_RETAINS:
+            actions.append(("delete", "secondary", date_string))
+        return actions
+
+
+def plan_sync(primary_policy, secondary_policy, primary_inventory,
+              secondary_inventory, current_date):
+    """
+    Yields the (action, site, date_string) tuples that sync the primary and
+    secondary sites' inventories with their RoundRobinDate policies.
+    """
+    planner = RRDSyncPlanner(primary_policy, secondary_policy)
+    return planner.plan(primary_inventory, secondary_inventory, current_date)
+
+
+class RRDSchedule:
+    """
+    One decoded retained set: the dates, and tiers retaining them, kept by
+    the policy with policy_hash on current_date for the dataset key.
+    """
+    def __init__(self, key, policy_hash, current_date, ordinals, tiers):
+        self.key = key
+        self.policy_hash = policy_hash
+        self.current_date = current_date
+        self.ordinals = ordinals
+        self.tiers = tiers
+
+    def get_dates_as_strings(self):
+        return [date.fromordinal(ordinal).isoformat()
+                for ordinal in self.ordinals]
+
+
+class RRDScheduleFormat:
+    """
+    Versioned binary encoding of retained sets. A file starts with the
+    magic and version, followed by one record per schedule:
+
+        8s  first 8 bytes of the SHA-1 of the policy's tier options
+        i   base ordinal, the current date
+        H   key length, then the UTF-8 key
+        H   run count, then one run per entry below
+
+    Keys are unicode, or bytes that are already UTF-8 encoded. The key
+    length and run count must each fit in 65535.
+
+    Retained dates are stored newest first as runs of (tiers, delta,
+    count): count dates holding the same tiers, each delta days older
+    than the one before. The first run starts delta days before the base
+    ordinal, so the current date is a run with a delta of 0. Runs longer
+    than 65535 dates are split into several runs.
+    """
+    MAGIC = b"RRDS"
+    VERSION = 1
+    FILE_HEADER = struct.Struct("<4sB")
+    RECORD_HEADER = struct.Struct("<8siHH")
+    RUN = struct.Struct("<BHH")
+    MAX_CACHED_RUNS = 256
+    runs_structs = {}
+    HASHED_OPTIONS = [
+        "days_to_retain",
+        "weeks_to_retain",
+        "months_to_retain",
+        "years_to_retain",
+        "backup_day_of_week",
+        "backup_day_of_month",
+        "backup_month_of_year",
+        "floor_date"
+    ]
+
+    def get_policy_hash(self, policy):
+        import hashlib
+        options = policy.get_options()
+        values = []
+        for name in self.HASHED_OPTIONS:
+            value = options.get(name)
+            if isinstance(value, date):
+                value = value.isoformat()
+            values.append("{0}={1}".format(name, value))
+        return hashlib.sha1(";".join(values).encode("utf8")).digest()[:8]
+
+    def get_runs(self, base, tier_ordinals):
+        runs = []
+        previous = base
+        for ordinal, tiers in tier_ordinals:
+            delta = previous - ordinal
+            if delta > 0xFFFF:
+                raise Exception("Retained dates must be at most 65535 days "
+                                "apart. Given '{0}'".format(delta))
+            if (runs and runs[-1][0] == tiers and runs[-1][1] == delta and
+                    runs[-1][2] < 0xFFFF):
+                runs[-1][2] += 1
+            else:
+                runs.append([tiers, delta, 1])
+            previous = ordinal
+        return runs
+
+    def encode(self, key, policy, current_date=None):
+        " Returns one record holding the policy's retained set "
+        if current_date is None:
+            current_date = policy.get_options()["current_date"]
+        current_date = RRDDateParser().parse(current_date)
+        base = current_date.toordinal()
+        runs = self.get_runs(base, policy._get_tier_ordinals(current_date))
+        if not isinstance(key, bytes):
+            key = key.encode("utf8")
+        if len(key) > 0xFFFF:
+            raise Exception("Keys must be at most 65535 bytes long. "
+                            "Given '{0}'".format(len(key)))
+        if len(runs) > 0xFFFF:
+            raise Exception("Records must hold at most 65535 runs. "
+                            "Given '{0}'".format(len(runs)))
+        buffer = bytearray(self.RECORD_HEADER.size + len(key) +
+                           self.RUN.size * len(runs))
+        self.RECORD_HEADER.pack_into(buffer, 0, self.get_policy_hash(policy),
+                                     base, len(key), len(runs))
+        offset = self.RECORD_HEADER.size
+        buffer[offset:offset + len(key)] = key
+        offset = offset + len(key)
+        for tiers, delta, count in runs:
+            self.RUN.pack_into(buffer, offset, tiers, delta, count)
+            offset = offset + self.RUN.size
+        return bytes(buffer)
+
+    def decode(self, view, offset=0):
+        """
+        Decodes the record at offset in a buffer or memoryview without
+        copying it. Returns the RRDSchedule and the offset after it.
+        """
+        policy_hash, base, key_length, run_count = \
+            self.RECORD_HEADER.unpack_from(view, offset)
+        offset = offset + self.RECORD_HEADER.size
+        key = struct.unpack_from("<{0}s".format(key_length), view,
+                                 offset)[0].decode("utf8")
+        offset = offset + key_length
+        runs = self._get_runs_struct(run_count)
+        if runs is not None:
+            values = runs.unpack_from(view, offset)
+        else:
+            values = []
+            for i in xrange(run_count):
+                values.extend(self.RUN.unpack_from(view, offset +
+                                                   self.RUN.size * i))
+        offset = offset + self.RUN.size * run_count
+        ordinals = array("l")
+        tiers = array("B")
+        previous = base
+        for i in xrange(0, len(values), 3):
+            run_tiers, delta, count = values[i:i + 3]
+            if delta:
+                first = previous - delta
+                previous = first - delta * (count - 1)
+                ordinals.extend(xrange(first, previous - 1, -delta))
+            else:
+                ordinals.append(previous)
+            tiers.extend([run_tiers] * count)
+        return (RRDSchedule(key, policy_hash, date.fromordinal(base),
+                            ordinals, tiers), offset)
+
+    def _get_runs_struct(self, run_count):
+        """
+        Typical records are unpacked with one struct holding all their
+        runs. Structs are cached per run count up to MAX_CACHED_RUNS, and
+        longer records are unpacked one run at a time, so the cache stays
+        small however long the decoder runs.
+        """
+        if run_count > self.MAX_CACHED_RUNS:
+            return None
+        runs = self.runs_structs.get(run_count)
+        if runs is None:
+            runs = struct.Struct("<" + "BHH" * run_count)
+            self.runs_structs[run_count] = runs
+        return runs
+
+
+class RRDScheduleWriter:
+    " Streams schedule records to a binary file after the format header "
+    def __init__(self, fileobj):
+        self.fileobj = fileobj
+        self.format = RRDScheduleFormat()
+        fileobj.write(self.format.FILE_HEADER.pack(self.format.MAGIC,
+                                                   self.format.VERSION))
+
+    def write(self, key, policy, current_date=None):
+        self.fileobj.write(self.format.encode(key, policy, current_date))
+
+
+class RRDScheduleReader:
+    """
+    Yields the RRDSchedule records of a file written by RRDScheduleWriter.
+    Records are decoded in place from a memoryview, so a mmap of the file
+    is read without copying it. Buffers that do not support memoryview,
+    such as Python 2 mmap objects, are read in place directly.
+    """
+    def __init__(self, buffer):
+        try:
+            self.view = memoryview(buffer)
+        except TypeError:
+            self.view = buffer
+        self.format = RRDScheduleFormat()
+        magic, version = self.format.FILE_HEADER.unpack_from(self.view, 0)
+        if magic != self.format.MAGIC:
+            raise Exception("Schedule file must start with {0!r}. "
+                            "Given {1!r}".format(self.format.MAGIC, magic))
+        if version != self.format.VERSION:
+            raise Exception("Schedule file version must be {0}. "
+                            "Given '{1}'".format(self.format.VERSION, version))
+
+    def __iter__(self):
+        offset = self.format.FILE_HEADER.size
+        while offset < len(self.view):
+            schedule, offset = self.format.decode(self.view, offset)
+            yield schedule
+
+
+# Validate the default options once, at import time.
+RoundRobinDateOptionsParser()._get_validated_default_options()
@@ -0,0 +1,147 @@
+#!/usr/bin/env python
+
+import sqlite3
+from datetime import date
+
+from roundrobindate import RRDDateParser
+
+
+class RRDSnapshotCatalog:
+    """
+    SQLite snapshot catalog indexed by dataset and date ordinal. A policy's
+    retained dates are translated into a few range and modulo predicates,
+    one per tier, so expired snapshots are marked and deleted with indexed
+    statements instead of row by row in Python.
+    """
+    def __init__(self, connection):
+        if not isinstance(connection, sqlite3.Connection):
+            connection = sqlite3.connect(connection)
+        self.connection = connection
+        self._create_tables()
+
+    def _create_tables(self):
+        with self.connection:
+            self.connection.execute("""
+                CREATE TABLE IF NOT EXISTS rrd_snapshots (
+                    dataset TEXT NOT NULL,
+                    ordinal INTEGER NOT NULL,
+                    month INTEGER NOT NULL,
+                    day INTEGER NOT NULL,
+                    size INTEGER NOT NULL DEFAULT 0,
+                    expired INTEGER NOT NULL DEFAULT 0,
+                    PRIMARY KEY (dataset, ordinal)
+                )
+            """)
+
+    def add(self, dataset, snapshot_date, size=0):
+        self.add_many([(dataset, snapshot_date, size)])
+
+    def add_many(self, rows):
+        " Adds (dataset, snapshot_date, size) rows in one transaction "
+        with self.connection:
+            self.connection.executemany("""
+                INSERT OR REPLACE INTO rrd_snapshots
+                    (dataset, ordinal, month, day, size, expired)
+                VALUES (?, ?, ?, ?, ?, 0)
+            """, (self._get_row(*row) for row in rows))
+
+    def _get_row(self, dataset, snapshot_date, size=0):
+        snapshot_date = RRDDateParser().parse(snapshot_date)
+        return (dataset, snapshot_date.toordinal(), snapshot_date.month,
+                snapshot_date.day, size)
+
+    def get_dates(self, dataset, expired=None):
+        " Returns a dataset's snapshot dates as ISO 8601 strings, newest first "
+        sql = "SELECT ordinal FROM rrd_snapshots WHERE dataset = ?"
+        params = [dataset]
+        if expired is not None:
+            sql = sql + " AND expired = ?"
+            params.append(int(expired))
+        sql = sql + " ORDER BY ordinal DESC"
+        rows = self.connection.execute(sql, params)
+        return [date.fromordinal(row[0]).isoformat() for row in rows]
+
+    def get_expired(self, dataset, until_date):
+        """
+        Returns (date_string, size) pairs for the dataset's snapshots marked
+        expired on or before until_date, oldest first.
+        """
+        until_date = RRDDateParser().parse(until_date)
+        rows = self.connection.execute("""
+            SELECT ordinal, size FROM rrd_snapshots
+            WHERE dataset = ? AND expired = 1 AND ordinal <= ?
+            ORDER BY ordinal
+        """, [dataset, until_date.toordinal()])
+        return [(date.fromordinal(ordinal).isoformat(), size)
+                for ordinal, size in rows]
+
+    def remove(self, dataset, snapshot_date):
+        snapshot_date = RRDDateParser().parse(snapshot_date)
+        with self.connection:
+            self.connection.execute("""
+                DELETE FROM rrd_snapshots WHERE dataset = ? AND ordinal = ?
+            """, [dataset, snapshot_date.toordinal()])
+
+    def get_retained_predicate(self, policy):
+        """
+        Returns an SQL predicate, and its parameters, matching the rows
+        retained by the RoundRobinDate policy on its current date. Rows
+        newer than the current date are always retained, so a stale policy
+        never expires the latest snapshots.
+        """
+        options = policy.get_options()
+        current_date = options["current_date"]
+        current = current_date.toordinal()
+        day = options["backup_day_of_month"]
+        clauses = ["ordinal >= ?"]
+        params = [current]
+
+        days = policy._get_day_ordinals(current_date)
+        if days:
+            clauses.append("ordinal BETWEEN ? AND ?")
+            params.extend([days[-1], days[0]])
+
+        weeks = policy._get_week_ordinals(current_date)
+        if weeks:
+            clauses.append("(ordinal BETWEEN ? AND ? AND (? - ordinal) % 7 = 0)")
+            params.extend([weeks[-1], weeks[0], weeks[0]])
+
+        months = policy._get_month_ordinals(current_date)
+        if months:
+            clauses.append("(day = ? AND ordinal BETWEEN ? AND ?)")
+            params.extend([day, months[-1], months[0]])
+
+        years = policy._get_year_ordinals(current_date)
+        if years:
+            clauses.append("(day = ? AND month = ? AND ordinal BETWEEN ? AND ?)")
+            params.extend([day, options["backup_month_of_year"], years[-1],
+                           years[0]])
+        return ("(" + " OR ".join(clauses) + ")", params)
+
+    def mark_expired(self, dataset, policy):
+        " Flags the dataset's snapshots the policy no longer retains "
+        with self.connection:
+            return self._mark_expired(dataset, policy)
+
+    def _mark_expired(self, dataset, policy):
+        predicate, params = self.get_retained_predicate(policy)
+        cursor = self.connection.execute("""
+            UPDATE rrd_snapshots SET expired = NOT {0} WHERE dataset = ?
+        """.format(predicate), params + [dataset])
+        return cursor.rowcount
+
+    def delete_expired(self, dataset, policy):
+        """
+        Marks and deletes the dataset's expired snapshots in one transaction.
+        Returns the number of snapshots deleted and their total size.
+        """
+        with self.connection:
+            self._mark_expired(dataset, policy)
+            count, size = self.connection.execute("""
+                SELECT COUNT(*), COALESCE(SUM(size), 0) FROM rrd_snapshots
+                WHERE dataset = ? AND expired = 1
+            """, [dataset]).fetchone()
+            self.connection.execute("""
+                DELETE FROM rrd_snapshots WHERE dataset = ? AND expired = 1
+            """, [dataset])
+        return (count, size)
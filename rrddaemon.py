@@ -0,0 +1,203 @@
+#!/usr/bin/env python
+
+import sqlite3
+import time
+from datetime import date, timedelta
+
+from roundrobindate import RRDCompiledPolicy, RRDDateParser
+
+
+class RRDTokenBucket:
+    """
+    Token bucket rate limiter. Tokens refill at rate per second up to
+    capacity. take() spends tokens, going into debt if needed, and returns
+    the seconds to wait before acting so the average rate holds.
+    """
+    def __init__(self, rate, capacity=None, clock=None):
+        if rate <= 0:
+            raise Exception("Value for rate must be greater than 0. "
+                            "Given '{0}'".format(rate))
+        if capacity is None:
+            capacity = max(rate, 1)
+        self.rate = float(rate)
+        self.capacity = float(capacity)
+        self.clock = clock or time.time
+        self.tokens = self.capacity
+        self.updated = self.clock()
+
+    def take(self, tokens=1):
+        now = self.clock()
+        self.tokens = min(self.capacity,
+                          self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        self.tokens = self.tokens - tokens
+        if self.tokens >= 0:
+            return 0.0
+        return -self.tokens / self.rate
+
+
+class RRDJobQueue:
+    """
+    SQLite queue of prune jobs, one per dataset and run date. A job stays
+    pending until complete() commits, so a restarted daemon resumes exactly
+    the jobs that did not finish, and queueing a job again is a no-op.
+    """
+    def __init__(self, connection):
+        if not isinstance(connection, sqlite3.Connection):
+            connection = sqlite3.connect(connection)
+        self.connection = connection
+        self._create_tables()
+
+    def _create_tables(self):
+        with self.connection:
+            self.connection.execute("""
+                CREATE TABLE IF NOT EXISTS rrd_jobs (
+                    dataset TEXT NOT NULL,
+                    ordinal INTEGER NOT NULL,
+                    not_before REAL NOT NULL,
+                    done INTEGER NOT NULL DEFAULT 0,
+                    deleted INTEGER NOT NULL DEFAULT 0,
+                    size INTEGER NOT NULL DEFAULT 0,
+                    PRIMARY KEY (dataset, ordinal)
+                )
+            """)
+            self.connection.execute("""
+                CREATE INDEX IF NOT EXISTS rrd_jobs_pending
+                ON rrd_jobs (done, not_before)
+            """)
+
+    def add_many(self, rows):
+        " Queues (dataset, run_date, not_before) rows in one transaction "
+        with self.connection:
+            self.connection.executemany("""
+                INSERT OR IGNORE INTO rrd_jobs (dataset, ordinal, not_before)
+                VALUES (?, ?, ?)
+            """, ((dataset, RRDDateParser().parse(run_date).toordinal(),
+                   not_before) for dataset, run_date, not_before in rows))
+
+    def get_next(self):
+        " Returns the pending (dataset, run_date, not_before) due first "
+        row = self.connection.execute("""
+            SELECT dataset, ordinal, not_before FROM rrd_jobs
+            WHERE done = 0 ORDER BY not_before, dataset LIMIT 1
+        """).fetchone()
+        if row is None:
+            return None
+        dataset, ordinal, not_before = row
+        return (dataset, date.fromordinal(ordinal), not_before)
+
+    def complete(self, dataset, run_date, deleted=0, size=0):
+        run_date = RRDDateParser().parse(run_date)
+        with self.connection:
+            self.connection.execute("""
+                UPDATE rrd_jobs SET done = 1, deleted = ?, size = ?
+                WHERE dataset = ? AND ordinal = ?
+            """, [deleted, size, dataset, run_date.toordinal()])
+
+    def count_pending(self):
+        return self.connection.execute(
+            "SELECT COUNT(*) FROM rrd_jobs WHERE done = 0").fetchone()[0]
+
+
+class RRDRetentionDaemon:
+    """
+    Long running retention enforcement. Each day one prune job per dataset
+    is queued, spread evenly over window_seconds, and deletions are rate
+    limited to deletes_per_second, so load stays flat instead of spiking
+    when every dataset is pruned at midnight.
+
+    Policies are compiled once. Snapshots are read from an
+    RRDSnapshotCatalog, and delete(dataset, date_string) is called for each
+    expired snapshot before it is removed from the catalog, so a restart
+    never deletes a snapshot twice unless it stopped between the two.
+    delete must therefore tolerate snapshots that are already gone. The
+    clock and sleep functions can be replaced, for example in tests.
+    """
+    def __init__(self, policies, catalog, queue, delete, window_seconds=3600,
+                 deletes_per_second=10, clock=None, sleep=None):
+        self.policies = {}
+        for dataset, policy in policies.iteritems():
+            self.policies[dataset] = RRDCompiledPolicy(policy.get_options())
+        self.catalog = catalog
+        self.queue = queue
+        self.delete = delete
+        self.window_seconds = window_seconds
+        self.clock = clock or time.time
+        self.sleep = sleep or time.sleep
+        self.bucket = RRDTokenBucket(deletes_per_second, clock=self.clock)
+
+    def schedule(self, run_date, window_start=None):
+        """
+        Queues a prune job for each dataset on run_date, spread evenly over
+        the window starting at window_start, a clock() time that defaults to
+        now. Returns the number of jobs.
+        """
+        if window_start is None:
+            window_start = self.clock()
+        datasets = sorted(self.policies)
+        interval = self.window_seconds / float(len(datasets) or 1)
+        self.queue.add_many((dataset, run_date, window_start + i * interval)
+                            for i, dataset in enumerate(datasets))
+        return len(datasets)
+
+    def run_pending(self):
+        """
+        Runs queued jobs as they fall due, sleeping in between, until the
+        queue is empty. Returns the number of jobs run.
+        """
+        count = 0
+        while True:
+            job = self.queue.get_next()
+            if job is None:
+                return count
+            dataset, run_date, not_before = job
+            wait = not_before - self.clock()
+            if wait > 0:
+                self.sleep(wait)
+            self.run_job(dataset, run_date)
+            count += 1
+
+    def run_job(self, dataset, run_date):
+        """
+        Deletes the dataset's snapshots expired on run_date, oldest first,
+        and completes the job. Snapshots newer than run_date are left alone,
+        so a job resumed late never deletes later backups. Returns the
+        number of snapshots deleted and their total size.
+        """
+        run_date = RRDDateParser().parse(run_date)
+        deleted, size = 0, 0
+        if dataset in self.policies:
+            options = dict(self.policies[dataset]._get_parsed_options())
+            options["current_date"] = run_date
+            self.catalog.mark_expired(dataset, RRDCompiledPolicy(options))
+            for snapshot_date, snapshot_size in self.catalog.get_expired(
+                    dataset, run_date):
+                wait = self.bucket.take()
+                if wait:
+                    self.sleep(wait)
+                self.delete(dataset, snapshot_date)
+                self.catalog.remove(dataset, snapshot_date)
+                deleted += 1
+                size += snapshot_size
+        self.queue.complete(dataset, run_date, deleted, size)
+        return (deleted, size)
+
+    def run(self, days=None):
+        """
+        Schedules and runs each day's jobs, then sleeps until the next day.
+        Runs forever unless a number of days is given.
+        """
+        day = 0
+        while days is None or day < days:
+            now = self.clock()
+            run_date = date.fromtimestamp(now)
+            self.schedule(run_date, now)
+            self.run_pending()
+            day += 1
+            if days is None or day < days:
+                self._sleep_until(run_date + timedelta(days=1))
+
+    def _sleep_until(self, next_date):
+        wait = time.mktime(next_date.timetuple()) - self.clock()
+        if wait > 0:
+            self.sleep(wait)
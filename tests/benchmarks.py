@@ -0,0 +1,126 @@
+#!/usr/bin/env python
+# -*- coding: utf8 -*-
+
+# python tests/benchmarks.py [name ...]
+#
+# Benchmarks for the optimized code paths against the straightforward Python
+# approach they replace. Not collected by nosetests.
+
+import io
+import json
+import os
+import sys
+import time
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from roundrobindate import (RoundRobinDate, RRDScheduleReader,
+        RRDScheduleWriter)
+from rrdcatalog import RRDSnapshotCatalog
+
+
+def timed(label, function, *args):
+    start = time.time()
+    result = function(*args)
+    print("{0:<40} {1:>8.3f}s".format(label, time.time() - start))
+    return result
+
+
+def benchmark_catalog(rows=1000000, datasets=100):
+    "Catalog predicates against loading rows and deleting one at a time"
+    days = rows // datasets
+    first_date = date.today() - timedelta(days=days)
+    snapshot_rows = []
+    for dataset in xrange(datasets):
+        for i in xrange(days):
+            snapshot_rows.append((str(dataset), first_date + timedelta(days=i)))
+    policy = RoundRobinDate({"anchor_date": first_date})
+
+    def python_loop(catalog):
+        connection = catalog.connection
+        retained = set(policy.get_dates_as_strings())
+        expired = []
+        for dataset, ordinal in connection.execute(
+                "SELECT dataset, ordinal FROM rrd_snapshots"):
+            if date.fromordinal(ordinal).isoformat() not in retained:
+                expired.append((dataset, ordinal))
+        with connection:
+            for row in expired:
+                connection.execute("DELETE FROM rrd_snapshots "
+                                   "WHERE dataset = ? AND ordinal = ?", row)
+        return len(expired)
+
+    def catalog_predicates(catalog):
+        deleted = 0
+        for dataset in xrange(datasets):
+            deleted += catalog.delete_expired(str(dataset), policy)[0]
+        return deleted
+
+    print("catalog: {0} rows, {1} datasets".format(len(snapshot_rows),
+                                                    datasets))
+    for label, function in (("python loop", python_loop),
+                            ("catalog predicates", catalog_predicates)):
+        catalog = RRDSnapshotCatalog(":memory:")
+        catalog.add_many(snapshot_rows)
+        deleted = timed("  " + label, function, catalog)
+        print("  deleted {0}".format(deleted))
+
+
+def benchmark_schedule(datasets=40000):
+    "Binary schedule records against JSON lists of date strings"
+    current_date = date.today()
+    policies = []
+    for i in xrange(datasets):
+        policies.append((u"dataset-{0}".format(i), RoundRobinDate({
+            "current_date": current_date,
+            "anchor_date": current_date - timedelta(days=i % 365),
+            "days_to_retain": 7 + i % 7,
+            "weeks_to_retain": 4 + i % 4,
+            "months_to_retain": 12 + i % 12,
+            "years_to_retain": 1 + i % 5
+        })))
+
+    def encode_json():
+        return json.dumps(dict((key, policy.get_dates_as_strings())
+                               for key, policy in policies))
+
+    def encode_binary():
+        fileobj = io.BytesIO()
+        writer = RRDScheduleWriter(fileobj)
+        for key, policy in policies:
+            writer.write(key, policy)
+        return fileobj.getvalue()
+
+    def decode_json_ordinals(data):
+        count = 0
+        for key, dates in json.loads(data).iteritems():
+            ordinals = [date(*map(int, value.split("-"))).toordinal()
+                        for value in dates]
+            count += len(ordinals)
+        return count
+
+    def decode_binary(data):
+        return sum(len(schedule.ordinals)
+                   for schedule in RRDScheduleReader(data))
+
+    print("schedule: {0} datasets".format(datasets))
+    encoded_json = timed("  encode json", encode_json)
+    encoded_binary = timed("  encode binary", encode_binary)
+    timed("  decode json", json.loads, encoded_json)
+    timed("  decode json to ordinals", decode_json_ordinals, encoded_json)
+    timed("  decode binary", decode_binary, encoded_binary)
+    print("  json {0} bytes, binary {1} bytes".format(len(encoded_json),
+                                                      len(encoded_binary)))
+
+
+BENCHMARKS = {
+    "catalog": benchmark_catalog,
+    "schedule": benchmark_schedule,
+}
+
+
+if __name__ == "__main__":
+    names = sys.argv[1:] or sorted(BENCHMARKS)
+    for name in names:
+        BENCHMARKS[name]()
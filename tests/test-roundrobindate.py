@@ -2,10 +2,23 @@
 
 # nosetests --with-coverage --cover-package=roundrobindate ./tests
 
+import os
+import subprocess
+import sys
 from nose.tools import *
+from nose.plugins.skip import SkipTest
 from roundrobindate import RoundRobinDate
 from datetime import date, timedelta
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# Seconds allowed for importing the library and a first get_dates_as_strings()
+# call in a fresh process, as prune hooks do once per dataset.
+IMPORT_BUDGET_SECONDS = 0.05
+
 class TestRoundRobinDate():
 
     def setup(self):
@@ -462,3 +475,232 @@ class TestRoundRobinDate():
             '2012-05-31', # Final Day
         ])
         assert_equal(results_set, expected)
+
+    def test_get_dates_with_huge_retain_options_stops_at_min_year(self):
+        "Retain forever sentinels stop at datetime.MINYEAR instead of raising"
+        new_options = {
+            "current_date": "0001-03-10",
+            "anchor_date": "2000-01-01",
+            "days_to_retain": 100000,
+            "weeks_to_retain": 100000,
+            "months_to_retain": 100000,
+            "years_to_retain": 100000
+        }
+        self.rrd.set_options(new_options)
+
+        result = self.rrd.get_dates_as_strings()
+        assert_equal(len(result), 69)
+        assert_equal(result[-1], "0001-01-01")
+
+        new_options = {
+            "current_date": "0003-06-15",
+            "days_to_retain": 0,
+            "weeks_to_retain": 0,
+            "months_to_retain": 0
+        }
+        self.rrd.set_options(new_options)
+
+        expected = [
+            "0003-06-15",
+            "0003-01-01",
+            "0002-01-01",
+            "0001-01-01"
+        ]
+        result = self.rrd.get_dates_as_strings()
+        assert_equal(result, expected)
+
+    def test_get_dates_with_floor_date(self):
+        "No date older than the floor date is returned"
+        new_options = {
+            "current_date": "2012-02-15",
+            "anchor_date": "2011-11-14",
+            "floor_date": "2011-11-14",
+            "days_to_retain": 3,
+            "weeks_to_retain": 100,
+            "months_to_retain": 100,
+            "years_to_retain": 100
+        }
+        self.rrd.set_options(new_options)
+
+        result = self.rrd.get_dates_as_strings()
+        assert_equal(len(result), 19)
+        assert_equal(result[-1], "2011-11-14")
+        assert_equal(result[-2], "2011-11-21")
+        assert_true("2011-12-14" in result)
+        assert_true("2011-11-14" in result)
+
+    def test_get_dates_array(self):
+        if numpy is None:
+            raise SkipTest("NumPy is not installed")
+        self.test_get_dates_with_generic_options()
+        result = self.rrd.get_dates_array()
+        assert_equal(result.dtype, numpy.dtype("M8[D]"))
+        assert_equal([str(d) for d in result], self.rrd.get_dates_as_strings())
+
+    def test_classify_array(self):
+        if numpy is None:
+            raise SkipTest("NumPy is not installed")
+        new_options = {
+            "current_date": "2012-11-15",
+            "anchor_date": "2011-11-14",
+            "days_to_retain": 1,
+            "weeks_to_retain": 1,
+            "months_to_retain": 1,
+            "years_to_retain": 1
+        }
+        self.rrd.set_options(new_options)
+
+        dates = numpy.array([
+            "2012-11-16",
+            "2012-11-15",
+            "2012-11-14",
+            "2012-11-13",
+            "2012-11-12",
+            "2012-10-14",
+            "2011-11-14",
+            "1969-12-31",
+        ], dtype="M8[D]")
+        expected = [
+            RoundRobinDate.TIER_NONE,
+            RoundRobinDate.TIER_TODAY,
+            RoundRobinDate.TIER_DAY | RoundRobinDate.TIER_MONTH |
+                RoundRobinDate.TIER_YEAR,
+            RoundRobinDate.TIER_NONE,
+            RoundRobinDate.TIER_WEEK,
+            RoundRobinDate.TIER_NONE,
+            RoundRobinDate.TIER_NONE,
+            RoundRobinDate.TIER_NONE,
+        ]
+        result = self.rrd.classify_array(dates)
+        assert_equal(result.dtype, numpy.dtype("u1"))
+        assert_equal(result.tolist(), expected)
+
+    def test_classify_array_matches_get_dates(self):
+        if numpy is None:
+            raise SkipTest("NumPy is not installed")
+        self.test_get_dates_with_default_options()
+        current = date(2012, 2, 29).toordinal()
+        ordinals = numpy.arange(current - 5000, current + 5)
+        dates = (ordinals - date(1970, 1, 1).toordinal()).astype("M8[D]")
+        result = self.rrd.classify_array(dates)
+        retained = [str(d) for d in dates[result != RoundRobinDate.TIER_NONE]]
+        assert_equal(retained[::-1], self.rrd.get_dates_as_strings())
+
+    def test_explain(self):
+        "Each retained date is listed once with every tier holding it"
+        new_options = {
+            "current_date": "2012-11-15",
+            "anchor_date": "2011-11-14",
+            "days_to_retain": 1,
+            "weeks_to_retain": 1,
+            "months_to_retain": 1,
+            "years_to_retain": 1
+        }
+        self.rrd.set_options(new_options)
+
+        expected = [
+            ("2012-11-15", ["today"]),
+            ("2012-11-14", ["day", "month", "year"]),
+            ("2012-11-12", ["week"]),
+        ]
+        result = self.rrd.explain()
+        assert_equal(result, expected)
+
+    def test_explain_given_dates(self):
+        self.test_get_dates_with_generic_options()
+        expected = [
+            ("2010-10-13", ["week"]),
+            ("2010-10-12", []),
+            ("2009-10-20", ["year"]),
+        ]
+        result = self.rrd.explain(["2010-10-13", date(2010, 10, 12),
+                                   "2009-10-20"])
+        assert_equal(result, expected)
+
+    def test_get_dates_for(self):
+        "Matches get_dates_as_strings for each date without changing options"
+        self.test_get_dates_with_generic_options()
+        current_dates = ["2010-10-20", date(2010, 10, 21), "2011-01-02"]
+        result = self.rrd.get_dates_for(current_dates)
+        assert_equal(len(result), 3)
+        assert_equal(result.current_dates[1], date(2010, 10, 21))
+        assert_equal(result.offsets[-1], len(result.ordinals))
+        for index, current_date in enumerate(current_dates):
+            rrd = RoundRobinDate(self.rrd.get_options())
+            rrd.set_options({"current_date": current_date})
+            assert_equal(result.get_dates_as_strings(index),
+                         rrd.get_dates_as_strings())
+            assert_equal([tiers for name, tiers in rrd.explain()],
+                         [rrd._get_tier_names(tiers)
+                          for tiers in result.get_tiers(index)])
+        assert_equal(self.rrd.get_options()["current_date"], date(2010, 10, 20))
+
+    def test_get_dates_for_no_dates(self):
+        result = self.rrd.get_dates_for([])
+        assert_equal(len(result), 0)
+        assert_equal(list(result.offsets), [0])
+
+    def test_set_options_is_parsed_on_first_use(self):
+        "Invalid options raise from the first query, not from set_options"
+        rrd = RoundRobinDate({"backup_day_of_week": 8})
+        assert_equal(rrd.pending_options, [{"backup_day_of_week": 8}])
+        assert_raises(Exception, rrd.get_dates)
+
+        rrd = RoundRobinDate({"current_date": "2011-01-01"})
+        rrd.set_options({"days_to_retain": 0})
+        rrd.set_options({"days_to_retain": 1})
+        assert_equal(rrd.get_options().get("days_to_retain"), 1)
+        assert_equal(rrd.pending_options, [])
+
+    def test_invalid_options_do_not_stick(self):
+        "Options set after invalid ones are used, as when parsed eagerly"
+        rrd = RoundRobinDate({"backup_day_of_week": 8})
+        assert_raises(Exception, rrd.get_dates)
+        rrd.set_options({"backup_day_of_week": 3})
+        assert_equal(rrd.get_options()["backup_day_of_week"], 3)
+
+        rrd = RoundRobinDate()
+        rrd.set_options({"backup_day_of_week": 8})
+        rrd.set_options({"backup_day_of_week": 3})
+        assert_raises(Exception, rrd.get_dates)
+        assert_equal(rrd.get_options()["backup_day_of_week"], 3)
+
+    def test_query_after_failed_parse_uses_last_valid_options(self):
+        options = {
+            "current_date": "2012-11-15",
+            "days_to_retain": 0,
+            "weeks_to_retain": 3,
+            "months_to_retain": 0,
+            "years_to_retain": 0,
+            "backup_day_of_week": 3
+        }
+        expected = RoundRobinDate(options).get_dates_as_strings()
+        for invalid in ({"backup_day_of_week": 8}, {"days_to_retain": "abc"}):
+            rrd = RoundRobinDate(options)
+            rrd.get_dates()
+            rrd.set_options(invalid)
+            assert_raises(Exception, rrd.get_dates)
+            assert_equal(rrd.get_dates_as_strings(), expected)
+
+    def test_import_and_first_call_budget(self):
+        """
+        Prune hooks import the library in a fresh process for every dataset,
+        so importing it and running a first query must stay fast. Takes the
+        best of three runs to smooth out process start up noise.
+        """
+        script = (
+            "import time\n"
+            "start = time.time()\n"
+            "from roundrobindate import RoundRobinDate\n"
+            "RoundRobinDate({'current_date': '2013-01-01'}).get_dates_as_strings()\n"
+            "print(time.time() - start)\n"
+        )
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        timings = []
+        for i in xrange(3):
+            output = subprocess.check_output([sys.executable, "-c", script],
+                                             cwd=root)
+            timings.append(float(output))
+        assert_true(min(timings) < IMPORT_BUDGET_SECONDS,
+                    "Import and first call took {0:.3f}s, over the {1}s "
+                    "budget".format(min(timings), IMPORT_BUDGET_SECONDS))
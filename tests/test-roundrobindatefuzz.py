@@ -0,0 +1,409 @@
+# -*- coding: utf8 -*-
+
+# nosetests --with-coverage --cover-package=roundrobindate --nocapture ./tests
+#
+# Differential fuzz harness. Random option sets are checked, over long runs of
+# consecutive current dates, against ReferenceTiers: the original tier
+# generators, which step back one date object at a time. Set RRD_FUZZ_SEED
+# and RRD_FUZZ_ITERATIONS to explore further.
+
+import os
+import random
+import time
+from nose.tools import *
+from nose.plugins.skip import SkipTest
+from roundrobindate import (RoundRobinDate, RRDPolicyGrid, RRDPolicyTable,
+        RRDScheduleFormat, RRDSizeModel, forecast, next_changes)
+from rrdcatalog import RRDSnapshotCatalog
+from datetime import date, timedelta
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+SEED = int(os.environ.get("RRD_FUZZ_SEED", 20121115))
+ITERATIONS = int(os.environ.get("RRD_FUZZ_ITERATIONS", 24))
+DAYS = 366
+
+DAY = RoundRobinDate.TIER_DAY
+WEEK = RoundRobinDate.TIER_WEEK
+MONTH = RoundRobinDate.TIER_MONTH
+YEAR = RoundRobinDate.TIER_YEAR
+
+
+class ReferenceTiers():
+    """
+    The original RoundRobinDate tier generators, pinned so optimized paths
+    can never drift from them. Returns {ordinal: tiers} for a current date.
+    Each tier steps back from the current date, so it stops at the first
+    date before floor_date, which keeps only the dates on or after it.
+    """
+    def __init__(self, options):
+        self.options = options
+        self.floor_date = options.get("floor_date") or date.min
+
+    def _in_range(self, tier_date):
+        return tier_date >= self.floor_date
+
+    def get_tiers(self, current_date):
+        tiers = {current_date.toordinal(): RoundRobinDate.TIER_TODAY}
+        for tier, generate in ((DAY, self._generate_day_dates),
+                               (WEEK, self._generate_week_dates),
+                               (MONTH, self._generate_month_dates),
+                               (YEAR, self._generate_year_dates)):
+            for tier_date in generate(current_date):
+                ordinal = tier_date.toordinal()
+                tiers[ordinal] = tiers.get(ordinal, 0) | tier
+        return tiers
+
+    def _generate_day_dates(self, current_date):
+        dates = []
+        for i in xrange(self.options.get("days_to_retain")):
+            if current_date == date.min:
+                break
+            current_date = current_date - timedelta(days=1)
+            if not self._in_range(current_date):
+                break
+            dates.append(current_date)
+        return dates
+
+    def _generate_week_dates(self, current_date):
+        dates = []
+        current_week_date = self._get_first_week(current_date)
+        for i in xrange(self.options.get("weeks_to_retain")):
+            if not self._in_range(current_week_date):
+                break
+            dates.append(current_week_date)
+            current_week_date = current_week_date - timedelta(weeks=1)
+        return dates
+
+    def _get_first_week(self, input_date):
+        backup_day_of_week = self.options.get("backup_day_of_week")
+        current_day_of_week = input_date.isoweekday()
+        if current_day_of_week > backup_day_of_week:
+            days_back = current_day_of_week - backup_day_of_week
+        else:
+            days_back = (current_day_of_week + 7) - backup_day_of_week
+        return input_date - timedelta(days=days_back)
+
+    def _generate_month_dates(self, current_date):
+        dates = []
+        current_month_date = self._get_first_month(current_date)
+        for i in xrange(self.options.get("months_to_retain")):
+            if not self._in_range(current_month_date):
+                break
+            dates.append(current_month_date)
+            current_month_date = self._get_previous_month(current_month_date)
+        return dates
+
+    def _get_first_month(self, input_date):
+        day = self.options["backup_day_of_month"]
+        current_month = date(input_date.year, input_date.month, day)
+        if current_month >= input_date:
+            current_month = self._get_previous_month(current_month)
+        return current_month
+
+    def _get_previous_month(self, input_date):
+        if input_date.month == 1:
+            return date(input_date.year - 1, 12, input_date.day)
+        return date(input_date.year, input_date.month - 1, input_date.day)
+
+    def _generate_year_dates(self, current_date):
+        dates = []
+        current_year_date = self._get_first_year(current_date)
+        for i in xrange(self.options.get("years_to_retain")):
+            if not self._in_range(current_year_date):
+                break
+            dates.append(current_year_date)
+            current_year_date = self._get_previous_year(current_year_date)
+        return dates
+
+    def _get_first_year(self, input_date):
+        day = self.options["backup_day_of_month"]
+        month = self.options["backup_month_of_year"]
+        current_year = date(input_date.year, month, day)
+        if current_year >= input_date:
+            current_year = self._get_previous_year(current_year)
+        return current_year
+
+    def _get_previous_year(self, input_date):
+        return date(input_date.year - 1, input_date.month, input_date.day)
+
+
+class TestRoundRobinDateFuzz():
+
+    def setup(self):
+        "Set up test fixtures"
+        self.random = random.Random(SEED)
+
+    def teardown(self):
+        "Tear down test fixtures"
+
+    def _get_random_date(self):
+        "Dates cluster around month ends, year ends and leap days"
+        year = self.random.randint(1990, 2030)
+        kind = self.random.randint(0, 4)
+        if kind == 0:
+            return date(year, 12, 31) - timedelta(days=self.random.randint(0, 3))
+        if kind == 1:
+            return date(year, 1, 1) + timedelta(days=self.random.randint(0, 3))
+        if kind == 2:
+            leap_year = year - year % 4
+            if leap_year % 100 == 0:
+                leap_year = leap_year - 4
+            return date(leap_year, 2, 29)
+        month_end = date(year, self.random.randint(1, 12), 28)
+        return month_end + timedelta(days=self.random.randint(-1, 4))
+
+    def _get_random_options(self):
+        options = {
+            "current_date": self._get_random_date(),
+            "auto_correct_backup_dates": True,
+            "days_to_retain": self.random.randint(0, 14),
+            "weeks_to_retain": self.random.randint(0, 10),
+            "months_to_retain": self.random.randint(0, 30),
+            "years_to_retain": self.random.randint(0, 12)
+        }
+        if not self.random.randint(0, 2):
+            self._set_random_floor_date(options)
+        if self.random.randint(0, 3):
+            options["anchor_date"] = self._get_random_date()
+        else:
+            options["backup_day_of_week"] = self.random.randint(1, 7)
+            options["backup_day_of_month"] = self.random.randint(1, 31)
+            options["backup_month_of_year"] = self.random.randint(1, 12)
+        return options
+
+    def _set_random_floor_date(self, options):
+        """
+        Floor dates fall up to a few years before the current date, or just
+        after it. Half of them come with a 100000 retain count, as used to
+        retain a tier forever, which the floor date clamps.
+        """
+        days_back = self.random.randint(-30, 1500)
+        options["floor_date"] = (options["current_date"] -
+                                 timedelta(days=days_back))
+        if self.random.randint(0, 1):
+            tier = self.random.choice(["days_to_retain", "weeks_to_retain",
+                                       "months_to_retain", "years_to_retain"])
+            options[tier] = 100000
+
+    def _iter_policies(self):
+        for i in xrange(ITERATIONS):
+            rrd = RoundRobinDate(self._get_random_options())
+            yield rrd, ReferenceTiers(rrd.get_options())
+
+    def _iter_dates(self, rrd, days=DAYS):
+        current_date = rrd.get_options()["current_date"]
+        for i in xrange(days):
+            yield current_date + timedelta(days=i)
+
+    def test_auto_correct_backup_dates(self):
+        "Days of the month > 28 are moved to the 1st of the next month"
+        for i in xrange(ITERATIONS):
+            options = self._get_random_options()
+            anchor_date = self._get_random_date()
+            options["anchor_date"] = anchor_date
+            parsed = RoundRobinDate(options).get_options()
+            if anchor_date.day > 28:
+                expected = (1, anchor_date.month % 12 + 1)
+            else:
+                expected = (anchor_date.day, anchor_date.month)
+            assert_equal((parsed["backup_day_of_month"],
+                          parsed["backup_month_of_year"]), expected)
+            options["auto_correct_backup_dates"] = False
+            if anchor_date.day > 28:
+                assert_raises(Exception, RoundRobinDate(options).get_dates)
+            else:
+                assert_equal(RoundRobinDate(options).get_dates(),
+                             RoundRobinDate(parsed).get_dates())
+
+    def test_tier_ordinals_match_reference(self):
+        for rrd, reference in self._iter_policies():
+            for current_date in self._iter_dates(rrd):
+                expected = sorted(reference.get_tiers(current_date).items(),
+                                  reverse=True)
+                result = rrd._get_tier_ordinals(current_date)
+                assert_equal(result, expected,
+                             (rrd.get_options(), current_date))
+
+    def test_get_dates_for_matches_reference(self):
+        for rrd, reference in self._iter_policies():
+            dates = list(self._iter_dates(rrd))
+            result = rrd.get_dates_for(dates)
+            for index, current_date in enumerate(dates):
+                expected = sorted(reference.get_tiers(current_date).items(),
+                                  reverse=True)
+                assert_equal(zip(result.get_ordinals(index),
+                                 result.get_tiers(index)), expected,
+                             (rrd.get_options(), current_date))
+
+    def test_tier_ordinals_match_reference(self):
+        "Each tier's ordinals match the pinned per tier generators"
+        for rrd, reference in self._iter_policies():
+            for current_date in self._iter_dates(rrd, DAYS // 20):
+                rrd.set_options({"current_date": current_date})
+                for tier, result, expected in (
+                    (DAY, rrd._get_day_ordinals(current_date),
+                        reference._generate_day_dates(current_date)),
+                    (WEEK, rrd._get_week_ordinals(current_date),
+                        reference._generate_week_dates(current_date)),
+                    (MONTH, rrd._get_month_ordinals(current_date),
+                        reference._generate_month_dates(current_date)),
+                    (YEAR, rrd._get_year_ordinals(current_date),
+                        reference._generate_year_dates(current_date))):
+                    assert_equal(sorted(result),
+                                 sorted(d.toordinal() for d in expected),
+                                 (tier, rrd.get_options(), current_date))
+                result = rrd.get_dates_as_strings()
+                expected = [date.fromordinal(ordinal).isoformat() for ordinal
+                            in sorted(reference.get_tiers(current_date),
+                                      reverse=True)]
+                assert_equal(result, expected)
+
+    def test_classify_array_matches_reference(self):
+        if numpy is None:
+            raise SkipTest("NumPy is not installed")
+        epoch = date(1970, 1, 1).toordinal()
+        for rrd, reference in self._iter_policies():
+            for current_date in self._iter_dates(rrd, DAYS // 20):
+                rrd.set_options({"current_date": current_date})
+                current = current_date.toordinal()
+                ordinals = numpy.arange(current - 5000, current + 10)
+                result = rrd.classify_array((ordinals - epoch).astype("M8[D]"))
+                tiers = reference.get_tiers(current_date)
+                expected = [tiers.get(ordinal, 0) for ordinal in ordinals]
+                assert_equal(result.tolist(), expected)
+
+    def test_policy_table_matches_reference(self):
+        policies = [rrd for rrd, reference in self._iter_policies()]
+        table = RRDPolicyTable(bytearray(RRDPolicyTable.ROW_SIZE *
+                                         len(policies)))
+        for index, rrd in enumerate(policies):
+            table.pack(index, rrd)
+        for index, rrd in enumerate(policies):
+            reference = ReferenceTiers(rrd.get_options())
+            current_date = rrd.get_options()["current_date"]
+            expected = sorted(reference.get_tiers(current_date), reverse=True)
+            assert_equal(table.evaluate(index), expected)
+
+    def test_schedule_format_matches_reference(self):
+        schedule_format = RRDScheduleFormat()
+        for rrd, reference in self._iter_policies():
+            for current_date in self._iter_dates(rrd, DAYS // 20):
+                record = schedule_format.encode(u"fuzz", rrd, current_date)
+                schedule, offset = schedule_format.decode(record)
+                expected = sorted(reference.get_tiers(current_date).items(),
+                                  reverse=True)
+                assert_equal(zip(schedule.ordinals, schedule.tiers), expected)
+
+    def test_catalog_predicate_matches_reference(self):
+        for rrd, reference in self._iter_policies():
+            current_date = rrd.get_options()["current_date"]
+            catalog = RRDSnapshotCatalog(":memory:")
+            catalog.add_many(("fuzz", current_date - timedelta(days=i))
+                             for i in xrange(5000))
+            catalog.mark_expired("fuzz", rrd)
+            expected = [date.fromordinal(ordinal).isoformat() for ordinal
+                        in sorted(reference.get_tiers(current_date),
+                                  reverse=True)
+                        if ordinal > current_date.toordinal() - 5000]
+            assert_equal(catalog.get_dates("fuzz", expired=False), expected)
+
+    def test_forecast_matches_reference(self):
+        size_model = RRDSizeModel("1990-01-01", 1000, 3)
+        for rrd, reference in self._iter_policies():
+            current_date = rrd.get_options()["current_date"]
+            result = forecast(rrd, current_date, DAYS // 4, size_model)
+            for index, forecast_date in enumerate(
+                    self._iter_dates(rrd, DAYS // 4)):
+                tiers = reference.get_tiers(forecast_date)
+                assert_equal(result.total[index], len(tiers),
+                             (rrd.get_options(), forecast_date))
+                assert_equal(result.bytes[index],
+                             sum(size_model.size(ordinal) for ordinal in tiers))
+
+    def test_policy_grid_matches_reference(self):
+        size_model = RRDSizeModel("1990-01-01", 1000, 3)
+        for i in xrange(ITERATIONS // 4):
+            options = self._get_random_options()
+            anchor_dates = [self._get_random_date(), self._get_random_date()]
+            retain_counts = [self.random.sample(xrange(limit), 2)
+                             for limit in (15, 11, 31, 13)]
+            grid = RRDPolicyGrid(anchor_dates, *retain_counts)
+            start_date = options["current_date"]
+            for row in grid.evaluate(start_date, DAYS // 12, size_model):
+                rrd = RoundRobinDate({
+                    "anchor_date": row[0],
+                    "days_to_retain": row[1],
+                    "weeks_to_retain": row[2],
+                    "months_to_retain": row[3],
+                    "years_to_retain": row[4]
+                })
+                reference = ReferenceTiers(rrd.get_options())
+                peak_count, max_gap, peak_bytes = 0, 0, 0
+                for day in xrange(DAYS // 12):
+                    current_date = start_date + timedelta(days=day)
+                    ordinals = sorted(reference.get_tiers(current_date),
+                                      reverse=True)
+                    peak_count = max(peak_count, len(ordinals))
+                    peak_bytes = max(peak_bytes, sum(
+                        size_model.size(ordinal) for ordinal in ordinals))
+                    for newer, older in zip(ordinals, ordinals[1:]):
+                        max_gap = max(max_gap, newer - older)
+                assert_equal(row[5:], (peak_count, max_gap, peak_bytes), row)
+
+    def test_next_changes_matches_reference(self):
+        """
+        A tier changes when its dates do. Yesterday's backup expiring is a
+        TIER_TODAY change.
+        """
+        for rrd, reference in self._iter_policies():
+            dates = list(self._iter_dates(rrd, DAYS // 2))
+            expected = []
+            previous = reference.get_tiers(dates[0])
+            for current_date in dates[1:]:
+                tiers = reference.get_tiers(current_date)
+                changed = 0
+                for tier in (DAY, WEEK, MONTH, YEAR):
+                    before = set(o for o, t in previous.items() if t & tier)
+                    after = set(o for o, t in tiers.items() if t & tier)
+                    if before != after:
+                        changed = changed | tier
+                if current_date.toordinal() - 1 not in tiers:
+                    changed = changed | RoundRobinDate.TIER_TODAY
+                if changed:
+                    expected.append((current_date, changed))
+                previous = tiers
+            result = next_changes(rrd, dates[0], len(expected))
+            assert_equal(result, expected)
+            if len(expected) < len(dates) - 1:
+                extra = next_changes(rrd, dates[0], len(expected) + 1)
+                assert_true(extra[-1][0] > dates[-1])
+
+    def test_throughput(self):
+        "Reports dates evaluated per second by the reference and fast paths"
+        policies = list(self._iter_policies())
+        start = time.time()
+        for rrd, reference in policies:
+            for current_date in self._iter_dates(rrd):
+                reference.get_tiers(current_date)
+        reference_seconds = time.time() - start
+
+        start = time.time()
+        for rrd, reference in policies:
+            for current_date in self._iter_dates(rrd):
+                rrd._get_tier_ordinals(current_date)
+        fast_seconds = time.time() - start
+
+        start = time.time()
+        for rrd, reference in policies:
+            rrd.get_dates_for(self._iter_dates(rrd))
+        batched_seconds = time.time() - start
+
+        evaluations = len(policies) * DAYS
+        print("\nreference: {0:.0f} dates/s, tier ordinals: {1:.0f} dates/s, "
+              "get_dates_for: {2:.0f} dates/s".format(
+              evaluations / reference_seconds, evaluations / fast_seconds,
+              evaluations / batched_seconds))
@@ -214,6 +214,7 @@ class TestRoundRobinDateOptionsParser():
         new_options = {
             "current_date": date(2011, 1, 1),
             "anchor_date": None,
+            "floor_date": None,
             "auto_correct_backup_dates": False,
             "backup_day_of_week": 1,
             "backup_day_of_month": 1,
@@ -234,3 +235,15 @@ class TestRoundRobinDateOptionsParser():
         expected = self.options_parser._get_default_options()
         result = self.options_parser.get_options()
         assert_equal(result, expected)
+
+    def test_set_option_floor_date(self):
+        "Test setting floor date with date object and date string"
+        new_option = {"floor_date": "2010-11-05"}
+        self.options_parser.set_options(new_option)
+        returned_options = self.options_parser.get_options()
+        assert_equal(returned_options.get("floor_date"), date(2010, 11, 5))
+
+        new_option = {"floor_date": date(2010, 12, 1)}
+        self.options_parser.set_options(new_option)
+        returned_options = self.options_parser.get_options()
+        assert_equal(returned_options.get("floor_date"), date(2010, 12, 1))
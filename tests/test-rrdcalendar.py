@@ -0,0 +1,76 @@
+# -*- coding: utf8 -*-
+
+# nosetests --with-coverage --cover-package=roundrobindate ./tests
+
+from nose.tools import *
+from roundrobindate import RRDCalendar
+from datetime import MAXYEAR, MINYEAR, date
+
+class TestRRDCalendar():
+
+    def setup(self):
+        "Set up test fixtures"
+        self.calendar = RRDCalendar()
+
+    def teardown(self):
+        "Tear down test fixtures"
+
+    def test_get_month_starts(self):
+        month_starts = self.calendar.get_month_starts()
+        assert_equal(len(month_starts), 400 * 12)
+        for year in (1, 4, 100, 399, 400):
+            for month in xrange(1, 13):
+                index = (year - MINYEAR) * 12 + month - 1
+                expected = date(year, month, 1).toordinal()
+                assert_equal(month_starts[index], expected)
+
+    def test_get_ordinal(self):
+        "Months outside the first 400 year cycle are offset by whole cycles"
+        for year in (1, 1900, 2000, 2012, 2013, MAXYEAR):
+            for month in xrange(1, 13):
+                expected = date(year, month, 17).toordinal()
+                result = self.calendar.get_ordinal(year * 12 + month - 1, 17)
+                assert_equal(result, expected)
+
+    def test_get_month_starts_is_shared(self):
+        "The table is built once per process"
+        month_starts = RRDCalendar().get_month_starts()
+        assert_true(self.calendar.get_month_starts() is month_starts)
+
+    def test_get_ordinals_for_months(self):
+        first_month = 2012 * 12 + 2 - 1
+        result = self.calendar.get_ordinals(first_month, 3, 15)
+        expected = [
+            date(2012, 2, 15).toordinal(),
+            date(2012, 1, 15).toordinal(),
+            date(2011, 12, 15).toordinal()
+        ]
+        assert_equal(result, expected)
+
+    def test_get_ordinals_for_years(self):
+        first_month = 2012 * 12 + 2 - 1
+        result = self.calendar.get_ordinals(first_month, 2, 28, 12)
+        expected = [
+            date(2012, 2, 28).toordinal(),
+            date(2011, 2, 28).toordinal()
+        ]
+        assert_equal(result, expected)
+
+    def test_get_ordinals_down_to_min_year(self):
+        first_month = MINYEAR * 12 + 1
+        result = self.calendar.get_ordinals(first_month, 2, 1)
+        expected = [date(1, 2, 1).toordinal(), date(1, 1, 1).toordinal()]
+        assert_equal(result, expected)
+        assert_equal(self.calendar.get_ordinals(first_month, 0, 1), [])
+
+    def test_get_ordinals_across_cycles(self):
+        first_month = 2001 * 12 + 2 - 1
+        result = self.calendar.get_ordinals(first_month, 40, 3)
+        expected = [date(2001 - (i + 10) // 12, 12 - (i + 10) % 12, 3).toordinal()
+                    for i in xrange(40)]
+        assert_equal(result, expected)
+
+        result = self.calendar.get_ordinals(first_month, 1000, 3, 12)
+        expected = [date(year, 2, 3).toordinal()
+                    for year in xrange(2001, 1001, -1)]
+        assert_equal(result, expected)
@@ -0,0 +1,104 @@
+# -*- coding: utf8 -*-
+
+# nosetests --with-coverage --cover-package=roundrobindate ./tests
+
+from nose.tools import *
+from roundrobindate import RoundRobinDate, RRDChangeScheduler, next_changes
+from datetime import date
+
+TODAY = RoundRobinDate.TIER_TODAY
+DAY = RoundRobinDate.TIER_DAY
+WEEK = RoundRobinDate.TIER_WEEK
+MONTH = RoundRobinDate.TIER_MONTH
+YEAR = RoundRobinDate.TIER_YEAR
+
+class TestRRDChangeScheduler():
+
+    def setup(self):
+        "Set up test fixtures"
+        self.weekly = RoundRobinDate({
+            "anchor_date": "2012-01-02",
+            "days_to_retain": 0,
+            "weeks_to_retain": 4,
+            "months_to_retain": 3,
+            "years_to_retain": 1
+        })
+        self.monthly = RoundRobinDate({
+            "anchor_date": "2011-12-15",
+            "days_to_retain": 0,
+            "weeks_to_retain": 0,
+            "months_to_retain": 6,
+            "years_to_retain": 0
+        })
+
+    def teardown(self):
+        "Tear down test fixtures"
+
+    def test_next_changes(self):
+        "Tiers change on the day after their backup day"
+        expected = [
+            (date(2012, 12, 21), TODAY),
+            (date(2012, 12, 22), TODAY),
+            (date(2012, 12, 23), TODAY),
+            (date(2012, 12, 24), TODAY),
+            (date(2012, 12, 25), WEEK),
+            (date(2012, 12, 26), TODAY),
+        ]
+        result = next_changes(self.weekly, "2012-12-20", 6)
+        assert_equal(result, expected)
+
+    def test_next_changes_without_day_tier(self):
+        """
+        Without a day tier the previous day's backup expires every day,
+        unless another tier keeps it
+        """
+        result = next_changes(self.weekly, "2012-12-30", 5)
+        expected = [
+            (date(2012, 12, 31), TODAY),
+            (date(2013, 1, 1), WEEK),
+            (date(2013, 1, 2), TODAY),
+            (date(2013, 1, 3), MONTH | YEAR),
+            (date(2013, 1, 4), TODAY),
+        ]
+        assert_equal(result, expected)
+
+    def test_next_changes_includes_day_after_backup_day(self):
+        result = next_changes(self.weekly, "2012-12-24", 1)
+        assert_equal(result, [(date(2012, 12, 25), WEEK)])
+
+    def test_next_changes_with_day_tier(self):
+        "The day tier rolls every day"
+        self.weekly.set_options({"days_to_retain": 2})
+        result = next_changes(self.weekly, "2012-12-30", 3)
+        expected = [
+            (date(2012, 12, 31), DAY),
+            (date(2013, 1, 1), DAY | WEEK),
+            (date(2013, 1, 2), DAY),
+        ]
+        assert_equal(result, expected)
+
+    def test_next_changes_without_retained_tiers(self):
+        "Only the current day is kept, so yesterday's backup always expires"
+        self.monthly.set_options({"months_to_retain": 0})
+        expected = [(date(2012, 1, day), TODAY) for day in xrange(2, 7)]
+        assert_equal(next_changes(self.monthly, "2012-01-01", 5), expected)
+
+    def test_next_changes_for_many_policies(self):
+        self.weekly.set_options({"days_to_retain": 6})
+        self.monthly.set_options({"days_to_retain": 31})
+        scheduler = RRDChangeScheduler({
+            "weekly": self.weekly,
+            "monthly": self.monthly
+        })
+        expected = [
+            (date(2012, 12, 30), "monthly", DAY),
+            (date(2012, 12, 30), "weekly", DAY),
+            (date(2012, 12, 31), "monthly", DAY),
+            (date(2012, 12, 31), "weekly", DAY),
+            (date(2013, 1, 1), "monthly", DAY),
+            (date(2013, 1, 1), "weekly", DAY | WEEK),
+        ]
+        result = scheduler.next_changes("2012-12-29", 6)
+        assert_equal(result, expected)
+        result = scheduler.next_changes("2013-01-15", 2)
+        assert_equal(result[0], (date(2013, 1, 16), "monthly", DAY | MONTH))
@@ -0,0 +1,90 @@
+# -*- coding: utf8 -*-
+
+# nosetests --with-coverage --cover-package=roundrobindate ./tests
+
+from nose.tools import *
+from nose.plugins.skip import SkipTest
+from roundrobindate import (RoundRobinDate, RRDForecaster, RRDSizeModel,
+        forecast)
+from datetime import date, timedelta
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+class TestRRDForecaster():
+
+    def setup(self):
+        "Set up test fixtures"
+        self.rrd = RoundRobinDate({
+            "anchor_date": "2010-10-20",
+            "days_to_retain": 6,
+            "weeks_to_retain": 4,
+            "months_to_retain": 6,
+            "years_to_retain": 2
+        })
+
+    def teardown(self):
+        "Tear down test fixtures"
+
+    def test_size_model_sum_range(self):
+        size_model = RRDSizeModel("2010-01-01", 100, 2)
+        origin = date(2010, 1, 1).toordinal()
+        assert_equal(size_model.size(origin + 10), 120)
+        expected = sum(size_model.size(origin + i) for i in xrange(3, 30, 7))
+        result = size_model.sum_range(origin + 3, origin + 29, 7)
+        assert_equal(result, expected)
+        assert_equal(size_model.sum_range(origin + 5, origin + 4), 0)
+
+    def test_forecast_generic_options(self):
+        "Tier contributions match the generic example in the readme"
+        result = forecast(self.rrd, "2010-10-20", 1)
+        expected = (date(2010, 10, 20), 19, 6, 4, 6, 2, 0)
+        assert_equal(result.get_row(0), expected)
+
+    def test_forecast_matches_daily_get_dates(self):
+        "Counts and bytes match calling get_dates() once per day"
+        start_date = date(2011, 12, 20)
+        size_model = RRDSizeModel("2010-01-01", 1000, 7)
+        result = forecast(self.rrd, start_date, 120, size_model)
+        assert_equal(len(result), 120)
+
+        for i in xrange(120):
+            current_date = start_date + timedelta(days=i)
+            self.rrd.set_options({"current_date": current_date})
+            dates = self.rrd.get_dates().values()
+            expected_bytes = sum(size_model.size(d.toordinal()) for d in dates)
+            assert_equal(result.get_date(i), current_date)
+            assert_equal(result.total[i], len(dates))
+            assert_equal(result.bytes[i], expected_bytes)
+
+    def test_forecast_rolls_over_after_last_day_of_february(self):
+        "A backup on the 28th rolls over on March 1st, not on the 29th"
+        self.rrd.set_options({"anchor_date": "2009-10-28"})
+        result = forecast(self.rrd, "2013-02-20", 20)
+        for index in xrange(len(result)):
+            self.rrd.set_options({"current_date": result.get_date(index)})
+            assert_equal(result.total[index], len(self.rrd.get_dates()))
+
+    def test_array_forecast_matches_daily_forecast(self):
+        "The NumPy path matches computing one day at a time"
+        if numpy is None:
+            raise SkipTest("NumPy is not installed")
+        size_model = RRDSizeModel("2005-01-01", 1000, 7)
+        for options in [
+                {},
+                {"floor_date": "2012-03-10"},
+                {"floor_date": "2014-01-01"},
+                {"anchor_date": "2009-10-28", "weeks_to_retain": 0},
+                {"days_to_retain": 40, "weeks_to_retain": 10},
+                {"days_to_retain": 0, "months_to_retain": 100000,
+                 "years_to_retain": 100000, "floor_date": "2001-01-01"}]:
+            self.rrd.set_options(options)
+            forecaster = RRDForecaster(self.rrd)
+            start_date = date(2012, 1, 1)
+            expected = forecaster._forecast_days(start_date, 1000, size_model)
+            result = forecaster._forecast_arrays(numpy, start_date, 1000,
+                                                 size_model)
+            for index in xrange(1000):
+                assert_equal(result.get_row(index), expected.get_row(index),
+                             options)
@@ -0,0 +1,124 @@
+# -*- coding: utf8 -*-
+
+# nosetests --with-coverage --cover-package=roundrobindate ./tests
+
+import json
+from StringIO import StringIO
+from nose.tools import *
+from roundrobindate import RRDManifestPruner
+
+class TestRRDManifestPruner():
+
+    def setup(self):
+        "Set up test fixtures"
+        self.dataset_options = {
+            "db": {
+                "days_to_retain": 2,
+                "weeks_to_retain": 0,
+                "months_to_retain": 0,
+                "years_to_retain": 0
+            },
+            "logs": {
+                "anchor_date": "2012-01-01",
+                "days_to_retain": 0,
+                "weeks_to_retain": 0,
+                "months_to_retain": 1,
+                "years_to_retain": 0
+            }
+        }
+        self.rows = [
+            ("db", "2012-02-10", 100),
+            ("logs", "2012-02-10", 7),
+            ("db", "2012-02-09", 100),
+            ("logs", "2012-02-01", 5),
+            ("db", "2012-02-01", 80),
+            ("logs", "2012-01-20", 3),
+            ("db", "2012-02-07", 90),
+            ("misc", "2011-01-01", 1000),
+        ]
+
+    def teardown(self):
+        "Tear down test fixtures"
+
+    def _get_jsonl_manifest(self):
+        lines = []
+        for dataset, snapshot_date, size in self.rows:
+            record = {
+                "dataset": dataset,
+                "snapshot_date": snapshot_date,
+                "size": size
+            }
+            lines.append(json.dumps(record))
+        return StringIO("\n".join(lines) + "\n")
+
+    def _get_csv_manifest(self):
+        lines = ["dataset,snapshot_date,size"]
+        for row in self.rows:
+            lines.append("{0},{1},{2}".format(*row))
+        return StringIO("\n".join(lines) + "\n")
+
+    def test_prune_jsonl_manifest(self):
+        pruner = RRDManifestPruner(self.dataset_options,
+                current_date="2012-02-10", chunk_size=3)
+        output = StringIO()
+        summary = pruner.prune(self._get_jsonl_manifest(), output)
+
+        expected = {
+            "db": {"kept": 2, "deleted": 2, "reclaimed_bytes": 170},
+            "logs": {"kept": 2, "deleted": 1, "reclaimed_bytes": 3},
+            "misc": {"kept": 1, "deleted": 0, "reclaimed_bytes": 0},
+        }
+        assert_equal(summary, expected)
+
+        decisions = [json.loads(line) for line in output.getvalue().splitlines()]
+        deleted = set((d["dataset"], d["snapshot_date"]) for d in decisions
+                      if d["action"] == "delete")
+        expected_deleted = set([
+            ("db", "2012-02-01"),
+            ("db", "2012-02-07"),
+            ("logs", "2012-01-20"),
+        ])
+        assert_equal(len(decisions), len(self.rows))
+        assert_equal(deleted, expected_deleted)
+
+    def test_prune_csv_manifest(self):
+        pruner = RRDManifestPruner(self.dataset_options,
+                current_date="2012-02-10")
+        output = StringIO()
+        summary = pruner.prune(self._get_csv_manifest(), output, "csv")
+        assert_equal(summary["db"]["reclaimed_bytes"], 170)
+
+        lines = output.getvalue().splitlines()
+        assert_equal(lines[0], "dataset,snapshot_date,size,action")
+        assert_equal(lines[1], "db,2012-02-10,100,keep")
+        assert_equal(len(lines), len(self.rows) + 1)
+
+    def test_prune_with_process_pool(self):
+        "Fanning chunks out to worker processes returns the same decisions"
+        serial = RRDManifestPruner(self.dataset_options,
+                current_date="2012-02-10", chunk_size=4)
+        parallel = RRDManifestPruner(self.dataset_options,
+                current_date="2012-02-10", chunk_size=4, processes=2)
+        serial_output = StringIO()
+        parallel_output = StringIO()
+        expected = serial.prune(self._get_jsonl_manifest(), serial_output)
+        result = parallel.prune(self._get_jsonl_manifest(), parallel_output)
+        assert_equal(result, expected)
+        assert_equal(parallel_output.getvalue(), serial_output.getvalue())
+
+    def test_prune_keeps_manifest_order(self):
+        for processes in (1, 2):
+            pruner = RRDManifestPruner(self.dataset_options,
+                    current_date="2012-02-10", chunk_size=3,
+                    processes=processes)
+            output = StringIO()
+            pruner.prune(self._get_csv_manifest(), output, "csv")
+            rows = [tuple(line.split(",")[:2])
+                    for line in output.getvalue().splitlines()[1:]]
+            assert_equal(rows, [row[:2] for row in self.rows])
+
+    def test_prune_with_invalid_format(self):
+        pruner = RRDManifestPruner(self.dataset_options)
+        def invalid_format():
+            pruner.prune(StringIO(""), StringIO(), "xml")
+        assert_raises(Exception, invalid_format)
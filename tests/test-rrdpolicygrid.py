@@ -0,0 +1,83 @@
+# -*- coding: utf8 -*-
+
+# nosetests --with-coverage --cover-package=roundrobindate ./tests
+
+import types
+from nose.tools import *
+from roundrobindate import RoundRobinDate, RRDPolicyGrid, RRDSizeModel
+from datetime import date, timedelta
+
+class TestRRDPolicyGrid():
+
+    def setup(self):
+        "Set up test fixtures"
+        self.size_model = RRDSizeModel("2009-01-01", 100, 3)
+
+    def teardown(self):
+        "Tear down test fixtures"
+
+    def _simulate(self, row, start_date, days, options=None):
+        " Evaluates one grid cell with a full RoundRobinDate per day "
+        anchor_date, days_to_retain, weeks_to_retain, months_to_retain, \
+            years_to_retain = row[:5]
+        rrd = RoundRobinDate(options or {})
+        rrd.set_options({
+            "anchor_date": anchor_date,
+            "days_to_retain": days_to_retain,
+            "weeks_to_retain": weeks_to_retain,
+            "months_to_retain": months_to_retain,
+            "years_to_retain": years_to_retain
+        })
+        peak_count, max_gap, peak_bytes = 0, 0, 0
+        for i in xrange(days):
+            rrd.set_options({"current_date": start_date + timedelta(days=i)})
+            ordinals = [retained_date.toordinal() for retained_date
+                        in sorted(rrd.get_dates().values(), reverse=True)]
+            peak_count = max(peak_count, len(ordinals))
+            peak_bytes = max(peak_bytes, sum(self.size_model.size(ordinal)
+                                             for ordinal in ordinals))
+            for newer, older in zip(ordinals, ordinals[1:]):
+                max_gap = max(max_gap, newer - older)
+        return row[:5] + (peak_count, max_gap, peak_bytes)
+
+    def test_generic_example(self):
+        "One cell on one day matches the generic example in the readme"
+        grid = RRDPolicyGrid(["2010-10-20"], [6], [4], [6], [2])
+        result = list(grid.evaluate("2010-10-20", 1, RRDSizeModel(
+            "2010-01-01", 1)))
+        expected = [("2010-10-20", 6, 4, 6, 2, 19, 365, 19.0)]
+        assert_equal(result, expected)
+
+    def test_rows_stream_in_grid_order(self):
+        grid = RRDPolicyGrid(["2011-01-03", "2010-05-31"], [7, 0], [4],
+                             [12, 3], [1])
+        result = grid.evaluate("2012-01-01", 10)
+        assert_true(isinstance(result, types.GeneratorType))
+        result = [row[:5] for row in result]
+        expected = [
+            ("2011-01-03", 0, 4, 3, 1),
+            ("2011-01-03", 0, 4, 12, 1),
+            ("2011-01-03", 7, 4, 3, 1),
+            ("2011-01-03", 7, 4, 12, 1),
+            ("2010-05-31", 0, 4, 3, 1),
+            ("2010-05-31", 0, 4, 12, 1),
+            ("2010-05-31", 7, 4, 3, 1),
+            ("2010-05-31", 7, 4, 12, 1),
+        ]
+        assert_equal(result, expected)
+        assert_equal(len(RRDPolicyGrid.columns), 8)
+
+    def test_grid_matches_daily_get_dates(self):
+        "Every cell matches simulating its own policy day by day"
+        start_date = date(2012, 1, 20)
+        grid = RRDPolicyGrid(["2010-10-20", "2011-02-28"], [0, 3, 10],
+                             [0, 2, 6], [0, 1, 13], [0, 3])
+        for row in grid.evaluate(start_date, 45, self.size_model):
+            assert_equal(row, self._simulate(row, start_date, 45))
+
+    def test_grid_with_floor_date(self):
+        start_date = date(2012, 1, 20)
+        options = {"floor_date": "2011-12-01"}
+        grid = RRDPolicyGrid(["2010-10-20"], [14], [8], [6], [2], options)
+        for row in grid.evaluate(start_date, 30, self.size_model):
+            assert_equal(row, self._simulate(row, start_date, 30, options))
@@ -0,0 +1,74 @@
+# -*- coding: utf8 -*-
+
+# nosetests --with-coverage --cover-package=roundrobindate ./tests
+
+from nose.tools import *
+from roundrobindate import (RoundRobinDate, RRDPolicyPool, RRDPolicyTable,
+        RRDResultTable)
+from datetime import date, timedelta
+
+class TestRRDPolicyTable():
+
+    def setup(self):
+        "Set up test fixtures"
+        self.policies = []
+        for i in xrange(12):
+            self.policies.append(RoundRobinDate({
+                "current_date": date(2012, 2, 29) + timedelta(days=i * 17),
+                "anchor_date": date(2010, 10, 20) + timedelta(days=i * 31),
+                "days_to_retain": i % 4,
+                "weeks_to_retain": i % 5,
+                "months_to_retain": i,
+                "years_to_retain": 100000
+            }))
+
+    def teardown(self):
+        "Tear down test fixtures"
+
+    def _get_expected(self, policy):
+        return [date(*map(int, d.split("-"))).toordinal()
+                for d in policy.get_dates_as_strings()]
+
+    def test_pack_and_get_policy(self):
+        table = RRDPolicyTable(bytearray(RRDPolicyTable.ROW_SIZE * 2))
+        assert_equal(table.rows, 2)
+        policy = self.policies[3]
+        table.pack(1, policy)
+
+        expected = policy.get_options()
+        del expected["auto_correct_backup_dates"]
+        result = table.get_policy(1).get_options()
+        assert_equal(result, expected)
+
+    def test_compiled_policy_is_read_only(self):
+        table = RRDPolicyTable(bytearray(RRDPolicyTable.ROW_SIZE))
+        table.pack(0, self.policies[3])
+        policy = table.get_policy(0)
+        expected = policy.get_dates_as_strings()
+        assert_raises(Exception, policy.set_options, {"days_to_retain": 1})
+        assert_equal(policy.get_dates_as_strings(), expected)
+
+    def test_evaluate(self):
+        buffer = bytearray(RRDPolicyTable.ROW_SIZE * len(self.policies))
+        table = RRDPolicyTable(buffer)
+        for index, policy in enumerate(self.policies):
+            table.pack(index, policy)
+        for index, policy in enumerate(self.policies):
+            assert_equal(table.evaluate(index), self._get_expected(policy))
+
+    def test_result_table(self):
+        buffer = bytearray(RRDResultTable.get_row_size(3) * 2)
+        table = RRDResultTable(buffer, 3)
+        table.write(0, [5, 4, 3])
+        table.write(1, [9])
+        assert_equal(table.read(0), [5, 4, 3])
+        assert_equal(table.read(1), [9])
+        def too_many_dates():
+            table.write(1, [1, 2, 3, 4])
+        assert_raises(Exception, too_many_dates)
+
+    def test_policy_pool(self):
+        pool = RRDPolicyPool(self.policies, processes=2, chunk_size=5)
+        result = pool.evaluate()
+        for index, policy in enumerate(self.policies):
+            assert_equal(result.read(index), self._get_expected(policy))
@@ -0,0 +1,133 @@
+# -*- coding: utf8 -*-
+
+# nosetests --with-coverage --cover-package=roundrobindate,rrddaemon ./tests
+
+import sqlite3
+import time
+from nose.tools import *
+from roundrobindate import RoundRobinDate
+from rrdcatalog import RRDSnapshotCatalog
+from rrddaemon import RRDJobQueue, RRDRetentionDaemon, RRDTokenBucket
+from datetime import date, timedelta
+
+class FakeClock():
+    " Clock whose sleep advances time instantly "
+    def __init__(self, now):
+        self.now = now
+        self.sleeps = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now = self.now + seconds
+
+
+class TestRRDRetentionDaemon():
+
+    def setup(self):
+        "Set up test fixtures"
+        self.connection = sqlite3.connect(":memory:")
+        self.catalog = RRDSnapshotCatalog(self.connection)
+        self.queue = RRDJobQueue(self.connection)
+        self.start = time.mktime(date(2012, 11, 15).timetuple())
+        self.clock = FakeClock(self.start)
+        self.policies = {}
+        for dataset, days_to_retain in (("a", 3), ("b", 5), ("c", 7)):
+            self.policies[dataset] = RoundRobinDate({
+                "anchor_date": "2010-10-20",
+                "days_to_retain": days_to_retain,
+                "weeks_to_retain": 0,
+                "months_to_retain": 0,
+                "years_to_retain": 0
+            })
+            self.catalog.add_many((dataset, date(2012, 11, 15) -
+                                   timedelta(days=i), 10) for i in xrange(10))
+        self.deleted = []
+
+    def teardown(self):
+        "Tear down test fixtures"
+
+    def _delete(self, dataset, snapshot_date):
+        self.deleted.append((self.clock(), dataset, snapshot_date))
+
+    def _get_daemon(self, delete=None, deletes_per_second=100):
+        return RRDRetentionDaemon(self.policies, self.catalog, self.queue,
+                delete or self._delete, window_seconds=900,
+                deletes_per_second=deletes_per_second, clock=self.clock,
+                sleep=self.clock.sleep)
+
+    def test_token_bucket(self):
+        bucket = RRDTokenBucket(2, 2, clock=self.clock)
+        assert_equal([bucket.take() for i in xrange(4)], [0, 0, 0.5, 1.0])
+        self.clock.sleep(1.0)
+        assert_equal(bucket.take(), 0.5)
+        assert_raises(Exception, RRDTokenBucket, 0)
+
+    def test_jobs_are_spread_over_window(self):
+        daemon = self._get_daemon()
+        assert_equal(daemon.schedule("2012-11-15"), 3)
+        assert_equal(daemon.schedule("2012-11-15"), 3)
+        assert_equal(self.queue.count_pending(), 3)
+        assert_equal(daemon.run_pending(), 3)
+        assert_equal(self.queue.count_pending(), 0)
+
+        started = {}
+        for now, dataset, snapshot_date in self.deleted:
+            started.setdefault(dataset, now - self.start)
+        assert_equal(started, {"a": 0, "b": 300, "c": 600})
+        assert_equal(self.catalog.get_dates("a"), [
+            "2012-11-15", "2012-11-14", "2012-11-13", "2012-11-12"])
+        assert_equal(len(self.catalog.get_dates("c")), 8)
+        assert_equal(len(self.deleted), 6 + 4 + 2)
+
+    def test_deletes_are_rate_limited(self):
+        daemon = self._get_daemon(deletes_per_second=2)
+        daemon.run_job("a", date(2012, 11, 15))
+        times = [now - self.start for now, dataset, snapshot_date
+                 in self.deleted]
+        assert_equal(times, [0, 0, 0.5, 1.0, 1.5, 2.0])
+
+    def test_run_job_accepts_date_strings(self):
+        daemon = self._get_daemon()
+        self.queue.add_many([("a", "2012-11-15", self.start)])
+        assert_equal(daemon.run_job("a", "2012-11-15"), (6, 60))
+        assert_equal(self.queue.count_pending(), 0)
+
+    def test_restart_resumes_without_redoing_work(self):
+        def crash_on_third_delete(dataset, snapshot_date):
+            if len(self.deleted) == 2:
+                raise IOError("Simulated crash")
+            self._delete(dataset, snapshot_date)
+
+        daemon = self._get_daemon(crash_on_third_delete)
+        daemon.schedule("2012-11-15")
+        assert_raises(IOError, daemon.run_pending)
+        assert_equal(self.queue.count_pending(), 3)
+
+        daemon = self._get_daemon()
+        daemon.schedule("2012-11-15")
+        assert_equal(daemon.run_pending(), 3)
+        deleted = [(dataset, snapshot_date) for now, dataset, snapshot_date
+                   in self.deleted]
+        assert_equal(len(deleted), len(set(deleted)))
+        assert_equal(len(deleted), 6 + 4 + 2)
+
+    def test_late_job_keeps_newer_snapshots(self):
+        "A job resumed after its run date never deletes later backups"
+        daemon = self._get_daemon()
+        daemon.run_job("a", date(2012, 11, 10))
+        dates = self.catalog.get_dates("a")
+        assert_equal(dates[:6], ["2012-11-15", "2012-11-14", "2012-11-13",
+                                 "2012-11-12", "2012-11-11", "2012-11-10"])
+        assert_equal(len(dates), 9)
+
+    def test_run_days(self):
+        "The second day prunes the day that rolled out of the day tier"
+        daemon = self._get_daemon()
+        daemon.run(days=2)
+        assert_true(self.clock() >= time.mktime(date(2012, 11, 16).timetuple()))
+        assert_equal(self.catalog.get_dates("a"), [
+            "2012-11-15", "2012-11-14", "2012-11-13"])
+        assert_equal(self.queue.count_pending(), 0)
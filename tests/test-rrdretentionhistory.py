@@ -0,0 +1,109 @@
+# -*- coding: utf8 -*-
+
+# nosetests --with-coverage --cover-package=roundrobindate ./tests
+
+from nose.tools import *
+from roundrobindate import (RoundRobinDate, RRDIntervalIndex,
+        RRDRetentionHistory, retained_on, retained_on_many)
+from datetime import date, timedelta
+
+class TestRRDRetentionHistory():
+
+    def setup(self):
+        "Set up test fixtures"
+        self.rrd = RoundRobinDate({
+            "anchor_date": "2011-05-23",
+            "days_to_retain": 6,
+            "weeks_to_retain": 5,
+            "months_to_retain": 6,
+            "years_to_retain": 2
+        })
+
+    def teardown(self):
+        "Tear down test fixtures"
+
+    def _replay(self, first_backup_date, as_of):
+        "Replays daily pruning the same way the integration tests do"
+        rrd = RoundRobinDate(self.rrd.get_options())
+        on_disk = set()
+        current_date = first_backup_date
+        while current_date <= as_of:
+            rrd.set_options({"current_date": current_date})
+            on_disk.add(current_date.isoformat())
+            on_disk.intersection_update(rrd.get_dates_as_strings())
+            current_date = current_date + timedelta(days=1)
+        return sorted(on_disk, reverse=True)
+
+    def test_interval_index_stab(self):
+        intervals = [(1, 5), (2, 3), (4, 10), (6, 7), (9, 12), (11, 11)]
+        index = RRDIntervalIndex(intervals)
+        for point in xrange(0, 14):
+            expected = sorted(i for i in intervals if i[0] <= point < i[1])
+            assert_equal(sorted(index.stab(point)), expected)
+
+    def test_retained_on_matches_daily_checks_for_over_a_year(self):
+        expected = [
+            '2012-05-31',
+            '2012-05-30',
+            '2012-05-29',
+            '2012-05-28',
+            '2012-05-27',
+            '2012-05-26',
+            '2012-05-25',
+            '2012-05-23',
+            '2012-05-21',
+            '2012-05-14',
+            '2012-05-07',
+            '2012-04-30',
+            '2012-04-23',
+            '2012-03-23',
+            '2012-02-23',
+            '2012-01-23',
+            '2011-12-23',
+            '2011-05-23',
+        ]
+        result = retained_on(self.rrd, "2011-05-23", "2012-05-31")
+        assert_equal(result, expected)
+
+    def test_retained_on_many(self):
+        first_backup_date = date(2011, 5, 23)
+        as_of_dates = [
+            date(2011, 5, 23),
+            date(2011, 8, 31),
+            date(2012, 2, 29),
+            date(2012, 12, 31),
+            date(2013, 6, 1)
+        ]
+        result = retained_on_many(self.rrd, first_backup_date, as_of_dates)
+        for as_of, retained in zip(as_of_dates, result):
+            assert_equal(retained, self._replay(first_backup_date, as_of))
+
+    def test_retained_on_many_with_floor_date(self):
+        self.rrd.set_options({"floor_date": "2011-09-10"})
+        first_backup_date = date(2011, 5, 23)
+        as_of_dates = [date(2011, 9, 1), date(2011, 9, 12), date(2012, 4, 1)]
+        result = retained_on_many(self.rrd, first_backup_date, as_of_dates)
+        for as_of, retained in zip(as_of_dates, result):
+            assert_equal(retained, self._replay(first_backup_date, as_of))
+
+    def test_retained_on_retain_forever(self):
+        "Lifetimes are computed in closed form, not by replaying each day"
+        self.rrd.set_options({
+            "days_to_retain": 100000,
+            "months_to_retain": 100000,
+            "years_to_retain": 100000
+        })
+        first_backup_date = date(2005, 1, 1)
+        as_of = date(2012, 1, 1)
+        expected = [(as_of - timedelta(days=i)).isoformat()
+                    for i in xrange((as_of - first_backup_date).days + 1)]
+        assert_equal(retained_on(self.rrd, first_backup_date, as_of), expected)
+        result = retained_on_many(self.rrd, first_backup_date, [as_of])
+        assert_equal(result, [expected])
+
+    def test_retained_on_after_last_date(self):
+        history = RRDRetentionHistory(self.rrd, "2011-05-23", "2011-06-30")
+        assert_equal(history.retained_on("2011-05-22"), [])
+        def after_last_date():
+            history.retained_on("2011-07-01")
+        assert_raises(Exception, after_last_date)
@@ -0,0 +1,138 @@
+# -*- coding: utf8 -*-
+
+# nosetests --with-coverage --cover-package=roundrobindate ./tests
+
+import io
+import json
+import mmap
+import os
+import tempfile
+from nose.tools import *
+from roundrobindate import (RoundRobinDate, RRDScheduleFormat,
+        RRDScheduleReader, RRDScheduleWriter)
+from datetime import date, timedelta
+
+class TestRRDScheduleFormat():
+
+    def setup(self):
+        "Set up test fixtures"
+        self.rrd = RoundRobinDate({
+            "current_date": "2012-11-15",
+            "anchor_date": "2010-10-20",
+            "days_to_retain": 6,
+            "weeks_to_retain": 4,
+            "months_to_retain": 6,
+            "years_to_retain": 2
+        })
+        self.format = RRDScheduleFormat()
+
+    def teardown(self):
+        "Tear down test fixtures"
+
+    def test_round_trip(self):
+        record = self.format.encode(u"dataset", self.rrd)
+        schedule, offset = self.format.decode(record)
+        assert_equal(offset, len(record))
+        assert_equal(schedule.key, u"dataset")
+        assert_equal(schedule.current_date, date(2012, 11, 15))
+        assert_equal(schedule.policy_hash, self.format.get_policy_hash(self.rrd))
+        assert_equal(schedule.get_dates_as_strings(),
+                     self.rrd.get_dates_as_strings())
+        assert_equal(zip(schedule.ordinals, schedule.tiers),
+                     self.rrd._get_tier_ordinals(date(2012, 11, 15)))
+
+    def test_runs(self):
+        "Days form one run and weeks another, each delta days apart"
+        self.rrd.set_options({"months_to_retain": 0, "years_to_retain": 0})
+        base = date(2012, 11, 15).toordinal()
+        tier_ordinals = self.rrd._get_tier_ordinals(date(2012, 11, 15))
+        expected = [
+            [RoundRobinDate.TIER_TODAY, 0, 1],
+            [RoundRobinDate.TIER_DAY | RoundRobinDate.TIER_WEEK, 1, 1],
+            [RoundRobinDate.TIER_DAY, 1, 5],
+            [RoundRobinDate.TIER_WEEK, 2, 1],
+            [RoundRobinDate.TIER_WEEK, 7, 2],
+        ]
+        assert_equal(self.format.get_runs(base, tier_ordinals), expected)
+
+    def test_round_trip_huge_day_tier(self):
+        "Runs holding more than 65535 dates are split"
+        self.rrd.set_options({"days_to_retain": 100000})
+        record = self.format.encode(u"dataset", self.rrd)
+        schedule, offset = self.format.decode(record)
+        assert_equal(offset, len(record))
+        assert_equal(zip(schedule.ordinals, schedule.tiers),
+                     self.rrd._get_tier_ordinals(date(2012, 11, 15)))
+        runs = self.format.get_runs(date(2012, 11, 15).toordinal(),
+                                    self.rrd._get_tier_ordinals(
+                                        date(2012, 11, 15)))
+        assert_equal(max(count for tiers, delta, count in runs), 0xFFFF)
+
+    def test_round_trip_many_runs(self):
+        "Records with more runs than MAX_CACHED_RUNS decode run by run"
+        self.rrd.set_options({"weeks_to_retain": 1000,
+                              "months_to_retain": 300})
+        record = self.format.encode(u"dataset", self.rrd)
+        schedule, offset = self.format.decode(record)
+        tier_ordinals = self.rrd._get_tier_ordinals(date(2012, 11, 15))
+        runs = self.format.get_runs(date(2012, 11, 15).toordinal(),
+                                    tier_ordinals)
+        assert_true(len(runs) > self.format.MAX_CACHED_RUNS)
+        assert_equal(offset, len(record))
+        assert_equal(zip(schedule.ordinals, schedule.tiers), tier_ordinals)
+        assert_true(len(runs) not in self.format.runs_structs)
+
+    def test_bytes_key(self):
+        record = self.format.encode(u"caf\xe9".encode("utf8"), self.rrd)
+        schedule, offset = self.format.decode(record)
+        assert_equal(schedule.key, u"caf\xe9")
+
+    @raises(Exception)
+    def test_key_too_long(self):
+        self.format.encode(u"k" * 0x10000, self.rrd)
+
+    @raises(Exception)
+    def test_too_many_runs(self):
+        self.format.get_runs = lambda base, tier_ordinals: [[1, 1, 1]] * 0x10000
+        self.format.encode(u"dataset", self.rrd)
+
+    def test_policy_hash_ignores_current_date(self):
+        policy_hash = self.format.get_policy_hash(self.rrd)
+        assert_equal(len(policy_hash), 8)
+        self.rrd.set_options({"current_date": "2013-01-01"})
+        assert_equal(self.format.get_policy_hash(self.rrd), policy_hash)
+        self.rrd.set_options({"days_to_retain": 7})
+        assert_not_equal(self.format.get_policy_hash(self.rrd), policy_hash)
+
+    def test_stream_many_schedules(self):
+        "Schedules stream through a file and decode in place from a mmap"
+        handle, path = tempfile.mkstemp()
+        try:
+            with os.fdopen(handle, "wb") as fileobj:
+                writer = RRDScheduleWriter(fileobj)
+                for i in xrange(50):
+                    writer.write(u"dataset-{0}".format(i), self.rrd,
+                                 date(2012, 11, 15) + timedelta(days=i))
+            with open(path, "rb") as fileobj:
+                mapped = mmap.mmap(fileobj.fileno(), 0, access=mmap.ACCESS_READ)
+                schedules = list(RRDScheduleReader(mapped))
+                for i, schedule in enumerate(schedules):
+                    self.rrd.set_options({"current_date":
+                                          schedule.current_date})
+                    assert_equal(schedule.key, u"dataset-{0}".format(i))
+                    assert_equal(schedule.get_dates_as_strings(),
+                                 self.rrd.get_dates_as_strings())
+                assert_equal(len(schedules), 50)
+                mapped.close()
+        finally:
+            os.remove(path)
+
+    def test_smaller_than_json(self):
+        record = self.format.encode(u"dataset", self.rrd)
+        encoded = json.dumps({"dataset": self.rrd.get_dates_as_strings()})
+        assert_true(len(record) * 3 < len(encoded))
+
+    def test_invalid_header(self):
+        assert_raises(Exception, RRDScheduleReader, b"JSON\x01")
+        assert_raises(Exception, RRDScheduleReader, b"RRDS\x02")
+        assert_equal(list(RRDScheduleReader(b"RRDS\x01")), [])
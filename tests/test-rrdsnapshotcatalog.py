@@ -0,0 +1,72 @@
+# -*- coding: utf8 -*-
+
+# nosetests --with-coverage --cover-package=roundrobindate,rrdcatalog ./tests
+
+from nose.tools import *
+from roundrobindate import RoundRobinDate
+from rrdcatalog import RRDSnapshotCatalog
+from datetime import date, timedelta
+
+class TestRRDSnapshotCatalog():
+
+    def setup(self):
+        "Set up test fixtures"
+        self.catalog = RRDSnapshotCatalog(":memory:")
+        self.rrd = RoundRobinDate({
+            "current_date": "2012-02-29",
+            "anchor_date": "2011-05-23",
+            "days_to_retain": 6,
+            "weeks_to_retain": 5,
+            "months_to_retain": 6,
+            "years_to_retain": 2
+        })
+        first_date = date(2009, 1, 1)
+        rows = []
+        # Snapshots up to and including the policy's current date
+        for i in xrange(1155):
+            snapshot_date = first_date + timedelta(days=i)
+            rows.append(("db", snapshot_date, 10))
+            rows.append(("logs", snapshot_date, 1))
+        self.catalog.add_many(rows)
+
+    def teardown(self):
+        "Tear down test fixtures"
+
+    def test_get_retained_predicate_matches_get_dates(self):
+        self.catalog.mark_expired("db", self.rrd)
+        result = self.catalog.get_dates("db", expired=False)
+        assert_equal(result, self.rrd.get_dates_as_strings())
+
+    def test_get_retained_predicate_without_tiers(self):
+        self.rrd.set_options({
+            "days_to_retain": 0,
+            "weeks_to_retain": 0,
+            "months_to_retain": 0,
+            "years_to_retain": 0
+        })
+        predicate, params = self.catalog.get_retained_predicate(self.rrd)
+        assert_equal(predicate, "(ordinal >= ?)")
+        assert_equal(params, [date(2012, 2, 29).toordinal()])
+
+    def test_delete_expired(self):
+        expected = self.rrd.get_dates_as_strings()
+        result = self.catalog.delete_expired("db", self.rrd)
+        assert_equal(result, ((1155 - len(expected)), (1155 - len(expected)) * 10))
+        assert_equal(self.catalog.get_dates("db"), expected)
+        assert_equal(len(self.catalog.get_dates("logs")), 1155)
+
+    def test_delete_expired_with_day_of_month_tiers(self):
+        "Month and year matches are checked against the stored day and month"
+        self.rrd.set_options({"anchor_date": "2008-07-15"})
+        expected = self.rrd.get_dates_as_strings()
+        self.catalog.delete_expired("logs", self.rrd)
+        assert_equal(self.catalog.get_dates("logs"), expected)
+
+    def test_delete_expired_keeps_snapshots_after_current_date(self):
+        "A stale policy must not expire snapshots taken after its current date"
+        self.catalog.add_many([("db", "2012-03-01", 10),
+                               ("db", "2012-03-02", 10)])
+        expected = (["2012-03-02", "2012-03-01"] +
+                    self.rrd.get_dates_as_strings())
+        self.catalog.delete_expired("db", self.rrd)
+        assert_equal(self.catalog.get_dates("db"), expected)
@@ -0,0 +1,97 @@
+# -*- coding: utf8 -*-
+
+# nosetests --with-coverage --cover-package=roundrobindate ./tests
+
+from nose.tools import *
+from roundrobindate import RoundRobinDate, plan_sync
+from datetime import date, timedelta
+
+class TestRRDSyncPlanner():
+
+    def setup(self):
+        "Set up test fixtures"
+        self.primary = RoundRobinDate({
+            "anchor_date": "2012-01-01",
+            "days_to_retain": 3,
+            "weeks_to_retain": 0,
+            "months_to_retain": 0,
+            "years_to_retain": 0
+        })
+        self.secondary = RoundRobinDate({
+            "anchor_date": "2012-01-01",
+            "days_to_retain": 3,
+            "weeks_to_retain": 0,
+            "months_to_retain": 2,
+            "years_to_retain": 0
+        })
+
+    def teardown(self):
+        "Tear down test fixtures"
+
+    def _get_inventory(self, first_date, last_date):
+        inventory = []
+        current_date = last_date
+        while current_date >= first_date:
+            inventory.append(current_date.isoformat())
+            current_date = current_date - timedelta(days=1)
+        return inventory
+
+    def test_plan_sync(self):
+        primary_inventory = self._get_inventory(date(2012, 1, 28),
+                                                date(2012, 2, 10))
+        secondary_inventory = [
+            "2012-02-08",
+            "2012-02-01",
+            "2012-01-20",
+            "2012-01-01"
+        ]
+        result = list(plan_sync(self.primary, self.secondary,
+                primary_inventory, secondary_inventory, "2012-02-10"))
+
+        expected = [
+            ("copy", "secondary", "2012-02-10"),
+            ("copy", "secondary", "2012-02-09"),
+            ("copy", "secondary", "2012-02-07"),
+            ("delete", "primary", "2012-02-06"),
+            ("delete", "primary", "2012-02-05"),
+            ("delete", "primary", "2012-02-04"),
+            ("delete", "primary", "2012-02-03"),
+            ("delete", "primary", "2012-02-02"),
+            ("delete", "primary", "2012-02-01"),
+            ("delete", "primary", "2012-01-31"),
+            ("delete", "primary", "2012-01-30"),
+            ("delete", "primary", "2012-01-29"),
+            ("delete", "primary", "2012-01-28"),
+            ("delete", "secondary", "2012-01-20"),
+        ]
+        assert_equal(result, expected)
+
+    def test_plan_sync_copies_to_primary(self):
+        result = list(plan_sync(self.secondary, self.primary,
+                ["2012-02-10"], ["2012-02-10", "2012-02-01"], "2012-02-10"))
+        expected = [
+            ("copy", "primary", "2012-02-01"),
+            ("delete", "secondary", "2012-02-01"),
+        ]
+        assert_equal(result, expected)
+
+    def test_plan_sync_applies_synced_plan(self):
+        "Applying the plan leaves each site with its retained backups"
+        primary_inventory = self._get_inventory(date(2011, 11, 1),
+                                                date(2012, 2, 10))
+        secondary_inventory = primary_inventory[::3]
+        primary = set(primary_inventory)
+        secondary = set(secondary_inventory)
+        sites = {"primary": primary, "secondary": secondary}
+        for action, site, date_string in plan_sync(self.primary,
+                self.secondary, primary_inventory, secondary_inventory,
+                "2012-02-10"):
+            if action == "copy":
+                sites[site].add(date_string)
+            else:
+                sites[site].remove(date_string)
+
+        self.primary.set_options({"current_date": "2012-02-10"})
+        self.secondary.set_options({"current_date": "2012-02-10"})
+        assert_equal(primary, set(self.primary.get_dates_as_strings()))
+        assert_equal(secondary, set(self.secondary.get_dates_as_strings()))